@@ -0,0 +1,110 @@
+from Source import LightSource
+from Hardware import OpticalChannel, SinglePhotonDetector
+
+import contextlib
+import io
+import math
+
+def expected_link_statistics(mu, survival_probability, detector_efficiency, prob_dark_count):
+    """Closed-form per-slot sifting and error probabilities of the Monte Carlo link model.
+
+    Mirrors the simulator: received photon numbers are Poisson(mu * survival_probability),
+    the interferometer sends min(previous, current) photons to the detector matching
+    Alice's phase difference and none to the other, and each detector adds dark counts
+    with prob_dark_count. A double click resolves to the correct bit, so an error needs
+    a dark count on the wrong detector while the correct one stays silent.
+    """
+    received_mu = mu * survival_probability
+
+    # E[(1 - eta)^min(X, Y)] for X, Y iid Poisson, using P(min >= k) = P(X >= k)^2
+    no_detection_probability = 0.0
+    poisson_pmf = math.exp(-received_mu)
+    survival_at_k = 1.0
+    k = 0
+    while survival_at_k > 1e-12:
+        survival_at_next_k = max(survival_at_k - poisson_pmf, 0.0)
+        no_detection_probability += (survival_at_k**2 - survival_at_next_k**2) * (1 - detector_efficiency)**k
+        k += 1
+        poisson_pmf *= received_mu / k
+        survival_at_k = survival_at_next_k
+
+    silent_correct_detector = no_detection_probability * (1 - prob_dark_count)
+    sift_probability = 1 - silent_correct_detector * (1 - prob_dark_count)
+    error_probability = silent_correct_detector * prob_dark_count
+
+    return {
+        'received_mu': received_mu,
+        'sift_probability': sift_probability,
+        'error_probability': error_probability,
+        'qber': error_probability / sift_probability if sift_probability > 0 else 0.0,
+    }
+
+def estimate_link(light_source, channel, detector):
+    """expected_link_statistics for concrete LightSource, OpticalChannel and SinglePhotonDetector objects."""
+    return expected_link_statistics(light_source.mu, channel.survival_probability,
+                                    detector.quantum_efficiency, detector.prob_dark_count_per_window)
+
+def estimate_point_to_point(num_pulses_per_link=10000, distance_km=20, mu=0.2, detector_efficiency=0.9,
+                            dark_count_rate_per_ns=1e-7, pulse_repetition_rate_ns=1, attenuation_db_per_km=0.2):
+    """Expected results of run_point_to_point_simulation for the same parameters, without simulating."""
+    statistics = estimate_link(LightSource(mu), OpticalChannel(distance_km, attenuation_db_per_km),
+                               SinglePhotonDetector(detector_efficiency, dark_count_rate_per_ns))
+
+    # the first slot has no preceding pulse and is never sifted
+    sifted_slots = max(num_pulses_per_link - 1, 0)
+    statistics['expected_sifted_key_length'] = sifted_slots * statistics['sift_probability']
+    statistics['expected_errors'] = sifted_slots * statistics['error_probability']
+    statistics['sifted_rate_per_pulse'] = (statistics['expected_sifted_key_length'] / num_pulses_per_link
+                                           if num_pulses_per_link > 0 else 0.0)
+    statistics['sifted_rate_bps'] = statistics['sift_probability'] / (pulse_repetition_rate_ns * 1e-9)
+    return statistics
+
+def pulses_for_target_key_length(target_sifted_bits, distance_km=20, mu=0.2, detector_efficiency=0.9,
+                                 dark_count_rate_per_ns=1e-7, attenuation_db_per_km=0.2):
+    """Number of pulses whose expected sifted key length reaches target_sifted_bits."""
+    statistics = estimate_point_to_point(1, distance_km, mu, detector_efficiency, dark_count_rate_per_ns,
+                                         attenuation_db_per_km=attenuation_db_per_km)
+    if statistics['sift_probability'] <= 0:
+        raise ValueError("The link never sifts a bit, so no pulse count reaches the target.")
+    return math.ceil(target_sifted_bits / statistics['sift_probability']) + 1
+
+def check_estimate_against_simulation(num_pulses_per_link=100000, distance_km=20, mu=0.2, detector_efficiency=0.9,
+                                      dark_count_rate_per_ns=1e-7, pulse_repetition_rate_ns=1, seed=None,
+                                      tolerance_sigmas=5):
+    """Runs the Monte Carlo simulator and checks it against the analytic estimate.
+
+    The sifted length and error count are compared with their expectations in units
+    of a binomial standard deviation. Neighbouring slots share a pulse, which the
+    generous default tolerance absorbs.
+    """
+    from main import run_point_to_point_simulation
+
+    estimate = estimate_point_to_point(num_pulses_per_link, distance_km, mu, detector_efficiency,
+                                       dark_count_rate_per_ns, pulse_repetition_rate_ns)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        sifted_key_length, qber = run_point_to_point_simulation(
+            num_pulses_per_link, distance_km, mu, detector_efficiency, dark_count_rate_per_ns,
+            pulse_repetition_rate_ns, seed=seed
+        )
+    num_errors = round(qber * sifted_key_length)
+
+    sifted_slots = max(num_pulses_per_link - 1, 0)
+    comparisons = {}
+    for name, observed, expected, probability in [
+        ('sifted_key_length', sifted_key_length, estimate['expected_sifted_key_length'], estimate['sift_probability']),
+        ('errors', num_errors, estimate['expected_errors'], estimate['error_probability']),
+    ]:
+        sigma = math.sqrt(max(sifted_slots * probability * (1 - probability), 1.0))
+        comparisons[name] = {
+            'observed': observed,
+            'expected': expected,
+            'z_score': (observed - expected) / sigma,
+        }
+
+    return {
+        'estimate': estimate,
+        'observed_qber': qber,
+        'comparisons': comparisons,
+        'consistent': all(abs(c['z_score']) <= tolerance_sigmas for c in comparisons.values()),
+    }
@@ -0,0 +1,224 @@
+from Source import LightSource, Sender
+from Hardware import OpticalChannel, Receiver
+from Network import Network, sift_keys
+from Keys import PackedKey
+from ErrorCorrection import cascade
+from PrivacyAmplification import amplify_privacy
+from Scheduler import EventScheduler
+from main import calculate_qber, run_point_to_point_simulation, run_multi_node_trusted_relay_simulation
+
+import argparse
+import contextlib
+import io
+import json
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+DEFAULT_SIZES = [10**3, 10**4, 10**5, 10**6, 10**7]
+# the per-pulse reference paths are far too slow to time at the largest sizes
+SCALAR_MAX_PULSES = 10**5
+SCHEDULER_MAX_REQUESTS = 10**5
+# scheduler stage: key requests arrive this often on average, on a chain of this many nodes
+SCHEDULER_REQUEST_INTERVAL_NS = 250
+SCHEDULER_CHAIN_NODES = 50
+DEFAULT_REGRESSION_TOLERANCE = 0.2
+
+def _prepared_link(num_pulses, seed=0):
+    """Pulses after source and channel, as the later stages see them."""
+    rng = np.random.default_rng(seed)
+    pulses = Sender(0.2, rng=rng).prepare_pulses(num_pulses)
+    received_photon_counts = OpticalChannel(20, rng=rng).transmit_pulses(pulses['photon_count'])
+    return pulses, received_photon_counts
+
+def _setup_light_source(num_pulses):
+    light_source = LightSource(0.2, rng=np.random.default_rng(0))
+    return lambda: light_source.generate_photon_counts(num_pulses)
+
+def _setup_light_source_scalar(num_pulses):
+    light_source = LightSource(0.2)
+    return lambda: [light_source.generate_single_pulse_photon_count() for _ in range(num_pulses)]
+
+def _setup_channel(num_pulses):
+    pulses, _ = _prepared_link(num_pulses)
+    channel = OpticalChannel(20, rng=np.random.default_rng(1))
+    return lambda: channel.transmit_pulses(pulses['photon_count'])
+
+def _setup_channel_scalar(num_pulses):
+    photon_counts = _prepared_link(num_pulses)[0]['photon_count'].tolist()
+    channel = OpticalChannel(20)
+    return lambda: [channel.transmit_pulse(photon_count) for photon_count in photon_counts]
+
+def _setup_receiver(num_pulses):
+    pulses, received_photon_counts = _prepared_link(num_pulses)
+    receiver = Receiver(0.9, 1e-7, rng=np.random.default_rng(2))
+    return lambda: receiver.measure_pulses(pulses['time_slot'], received_photon_counts, pulses['modulated_phase'])
+
+def _setup_receiver_scalar(num_pulses):
+    pulses, received_photon_counts = _prepared_link(num_pulses)
+    time_slots = pulses['time_slot'].tolist()
+    photons = received_photon_counts.tolist()
+    phases = pulses['modulated_phase'].tolist()
+    receiver = Receiver(0.9, 1e-7)
+
+    def measure_every_slot():
+        for i in range(len(time_slots)):
+            receiver.receive_and_measure(time_slots[i], photons[i], phases[i],
+                                         photons[i - 1] if i else 0, phases[i - 1] if i else 0.0)
+    return measure_every_slot
+
+def _setup_sifting(num_pulses):
+    pulses, received_photon_counts = _prepared_link(num_pulses)
+    measurements = Receiver(0.9, 1e-7, rng=np.random.default_rng(2)).measure_pulses(
+        pulses['time_slot'], received_photon_counts, pulses['modulated_phase']
+    )
+    return lambda: sift_keys(pulses['modulated_phase'], measurements['bob_inferred_bit'])
+
+def _setup_calculate_qber(num_pulses):
+    # num_pulses is used as the key length here
+    rng = np.random.default_rng(3)
+    alice_key = PackedKey.from_bits(rng.integers(0, 2, size=num_pulses, dtype=np.uint8))
+    bob_key = PackedKey.from_bits(rng.integers(0, 2, size=num_pulses, dtype=np.uint8))
+    return lambda: calculate_qber(alice_key, bob_key)
+
+def _setup_cascade(num_pulses):
+    # num_pulses is used as the key length here, with a 3% error rate
+    rng = np.random.default_rng(4)
+    alice_bits = rng.integers(0, 2, size=num_pulses, dtype=np.uint8)
+    alice_key = PackedKey.from_bits(alice_bits)
+    bob_key = PackedKey.from_bits(alice_bits ^ (rng.random(num_pulses) < 0.03))
+    return lambda: cascade(alice_key, bob_key, 0.03, seed=0)
+
+def _setup_privacy_amplification(num_pulses):
+    # num_pulses is used as the key length here
+    key = PackedKey.from_bits(np.random.default_rng(5).integers(0, 2, size=num_pulses, dtype=np.uint8))
+    return lambda: amplify_privacy(key, 0.03, int(0.2 * num_pulses), seed=0)
+
+def _setup_point_to_point(num_pulses):
+    return lambda: run_point_to_point_simulation(num_pulses, distance_km=20, seed=0)
+
+def _setup_multi_relay(num_pulses):
+    return lambda: run_multi_node_trusted_relay_simulation(num_pulses, link_distance_km=20, num_relays=2, seed=0)
+
+def _setup_scheduler(num_pulses):
+    # num_pulses is used as the number of end-to-end key requests, each over five hops
+    def schedule_requests():
+        network = Network()
+        for node_id in range(SCHEDULER_CHAIN_NODES):
+            network.add_node(node_id)
+        for node_id in range(1, SCHEDULER_CHAIN_NODES):
+            network.connect_nodes(node_id - 1, node_id, 10)
+        scheduler = EventScheduler(network, seed=0)
+        scheduler.add_all_links()
+        rng = np.random.default_rng(6)
+        until_ns = num_pulses * SCHEDULER_REQUEST_INTERVAL_NS
+        senders = rng.integers(0, SCHEDULER_CHAIN_NODES - 5, size=num_pulses)
+        for sender_id, num_bits, at_ns in zip(senders.tolist(), rng.integers(1, 65, size=num_pulses).tolist(),
+                                              rng.uniform(0, until_ns, size=num_pulses).tolist()):
+            scheduler.request_key(sender_id, sender_id + 5, num_bits, at_ns=at_ns)
+        return scheduler.run(until_ns)
+    return schedule_requests
+
+STAGES = {
+    'light_source': (_setup_light_source, None),
+    'light_source_scalar': (_setup_light_source_scalar, SCALAR_MAX_PULSES),
+    'channel': (_setup_channel, None),
+    'channel_scalar': (_setup_channel_scalar, SCALAR_MAX_PULSES),
+    'receiver': (_setup_receiver, None),
+    'receiver_scalar': (_setup_receiver_scalar, SCALAR_MAX_PULSES),
+    'sifting': (_setup_sifting, None),
+    'calculate_qber': (_setup_calculate_qber, None),
+    'cascade': (_setup_cascade, None),
+    'privacy_amplification': (_setup_privacy_amplification, None),
+    'point_to_point': (_setup_point_to_point, None),
+    'multi_relay': (_setup_multi_relay, None),
+    'scheduler': (_setup_scheduler, SCHEDULER_MAX_REQUESTS),
+}
+
+def measure(setup, num_pulses, repeats=3):
+    """Times the callable built by setup(num_pulses) and records its peak traced memory.
+
+    The fastest of `repeats` runs is kept. Peak memory comes from a separate run under
+    tracemalloc, so tracing overhead does not distort the timing.
+    """
+    run = setup(num_pulses)
+    best_seconds = float('inf')
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeats):
+            start_time = time.perf_counter()
+            run()
+            best_seconds = min(best_seconds, time.perf_counter() - start_time)
+
+        tracemalloc.start()
+        try:
+            run()
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return {
+        'seconds': best_seconds,
+        'pulses_per_s': num_pulses / best_seconds if best_seconds > 0 else float('inf'),
+        'peak_memory_mb': peak_bytes / 2**20,
+    }
+
+def run_benchmarks(stages=None, sizes=None, repeats=3):
+    """Runs each stage at each size and returns {stage: {size: measurement}}."""
+    results = {}
+    for stage in stages or list(STAGES):
+        if stage not in STAGES:
+            raise ValueError(f"Unknown benchmark stage '{stage}'. Expected one of {list(STAGES)}.")
+        setup, max_pulses = STAGES[stage]
+        results[stage] = {}
+        for num_pulses in sizes or DEFAULT_SIZES:
+            if max_pulses is not None and num_pulses > max_pulses:
+                continue
+            # the big end-to-end runs take long enough that one repeat is representative
+            stage_repeats = 1 if num_pulses >= 10**6 else repeats
+            results[stage][str(num_pulses)] = measure(setup, num_pulses, stage_repeats)
+            result = results[stage][str(num_pulses)]
+            print(f"{stage:<20} {num_pulses:>10} pulses  {result['seconds']:>10.4f} s  "
+                  f"{result['pulses_per_s']:>14.0f} pulses/s  {result['peak_memory_mb']:>9.1f} MB peak")
+    return results
+
+def compare_with_baseline(results, baseline, tolerance=DEFAULT_REGRESSION_TOLERANCE):
+    """Prints throughput relative to a stored baseline and returns the regressed (stage, size) pairs."""
+    regressions = []
+    for stage, stage_results in results.items():
+        for size, result in stage_results.items():
+            baseline_result = baseline.get(stage, {}).get(size)
+            if baseline_result is None:
+                continue
+            ratio = result['pulses_per_s'] / baseline_result['pulses_per_s']
+            regressed = ratio < 1 - tolerance
+            if regressed:
+                regressions.append((stage, size))
+            print(f"{stage:<20} {size:>10} pulses  {ratio:>6.2f}x baseline throughput"
+                  f"{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the QKD simulator stage by stage.")
+    parser.add_argument('--stages', nargs='+', default=None, help=f"Stages to run (default: all of {list(STAGES)}).")
+    parser.add_argument('--sizes', nargs='+', type=int, default=None, help="Pulse counts (default: 10^3 to 10^7).")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--save-baseline', metavar='PATH', help="Store these results as the baseline.")
+    parser.add_argument('--baseline', metavar='PATH', help="Compare against a stored baseline.")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_REGRESSION_TOLERANCE,
+                        help="Allowed relative throughput drop before a point counts as a regression.")
+    args = parser.parse_args()
+
+    benchmark_results = run_benchmarks(args.stages, args.sizes, args.repeats)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as baseline_file:
+            json.dump(benchmark_results, baseline_file, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            stored_baseline = json.load(baseline_file)
+        if compare_with_baseline(benchmark_results, stored_baseline, args.tolerance):
+            sys.exit(1)
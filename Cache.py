@@ -0,0 +1,136 @@
+from Storage import KeyStore
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_MAX_MEMORY_BYTES = 256 * 2**20
+DEFAULT_MAX_DISK_BYTES = 4 * 2**30
+
+def seed_identity(seed):
+    """JSON-able identity of an int or SeedSequence seed; None when the seed cannot be replayed."""
+    if isinstance(seed, (int, np.integer)) and not isinstance(seed, bool):
+        return {'entropy': str(int(seed))}
+    if isinstance(seed, np.random.SeedSequence):
+        return {'entropy': str(seed.entropy), 'spawn_key': [int(part) for part in seed.spawn_key],
+                'pool_size': seed.pool_size}
+    return None
+
+def link_cache_key(config):
+    """Content address of a link simulation: the SHA-256 of its configuration, seed included."""
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=float).encode()).hexdigest()
+
+class LinkResultCache:
+    """Two-tier cache of link results: sifted keys plus the session's statistics.
+
+    The memory tier is an LRU dict bounded by the packed size of the keys it holds. With
+    a directory, results are also written to a KeyStore there. Disk hits are copied into
+    memory, so no file stays mapped, and the least recently used disk entries are evicted
+    once the files pass max_disk_bytes. Several processes may share the directory. Callers
+    get copies, so mutating a returned key never changes the cache.
+    """
+
+    def __init__(self, max_memory_bytes=DEFAULT_MAX_MEMORY_BYTES, directory=None,
+                 max_disk_bytes=DEFAULT_MAX_DISK_BYTES):
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.store = KeyStore(directory) if directory is not None else None
+        self._memory = OrderedDict()
+        self.memory_bytes = 0
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+
+    @staticmethod
+    def _entry_size(entry):
+        return entry['alice'].nbytes + entry['bob'].nbytes
+
+    def __contains__(self, cache_key):
+        return cache_key in self._memory or (self.store is not None and f"{cache_key}-alice" in self.store)
+
+    def get(self, cache_key):
+        """Returns {'alice', 'bob', 'counters'} for a cached link result, or None."""
+        entry = self._memory.get(cache_key)
+        if entry is not None:
+            self._memory.move_to_end(cache_key)
+            self.stats['memory_hits'] += 1
+        else:
+            entry = self._load(cache_key) if self.store is not None else None
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['disk_hits'] += 1
+            self._remember(cache_key, entry)
+        return {'alice': entry['alice'].copy(), 'bob': entry['bob'].copy(), 'counters': dict(entry['counters'])}
+
+    def _load(self, cache_key):
+        """Reads an entry from the disk tier into memory; None if it is missing or being evicted."""
+        if f"{cache_key}-alice" not in self.store:
+            return None
+        try:
+            entry = {
+                'alice': self.store.open(f"{cache_key}-alice").copy(),
+                'bob': self.store.open(f"{cache_key}-bob").copy(),
+                'counters': self.store.metadata(f"{cache_key}-alice")['counters'],
+            }
+            # a touched file counts as recently used for disk eviction
+            os.utime(self.store.metadata_path(f"{cache_key}-alice"))
+        except (FileNotFoundError, ValueError):
+            return None
+        return entry
+
+    def put(self, cache_key, alice_sifted_key, bob_sifted_key, counters):
+        entry = {'alice': alice_sifted_key.copy(), 'bob': bob_sifted_key.copy(), 'counters': dict(counters)}
+        self._remember(cache_key, entry)
+        if self.store is not None and f"{cache_key}-alice" not in self.store:
+            # the alice metadata is written last, so a half-written entry is never found
+            self.store.write(f"{cache_key}-bob", entry['bob'])
+            self.store.write(f"{cache_key}-alice", entry['alice'], {'counters': entry['counters']})
+            self._evict_disk()
+
+    def _remember(self, cache_key, entry):
+        if cache_key in self._memory:
+            self.memory_bytes -= self._entry_size(self._memory.pop(cache_key))
+        entry_size = self._entry_size(entry)
+        if entry_size > self.max_memory_bytes:
+            return
+        self._memory[cache_key] = entry
+        self.memory_bytes += entry_size
+        while self.memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self.memory_bytes -= self._entry_size(evicted)
+            self.stats['evictions'] += 1
+
+    def _evict_disk(self):
+        entries = []
+        total_bytes = 0
+        for name in self.store.names():
+            if not name.endswith('-alice'):
+                continue
+            cache_key = name[:-len('-alice')]
+            paths = [self.store.key_path(f"{cache_key}-alice"), self.store.metadata_path(f"{cache_key}-alice"),
+                     self.store.key_path(f"{cache_key}-bob"), self.store.metadata_path(f"{cache_key}-bob")]
+            try:
+                # another process sharing the directory may evict the entry meanwhile
+                last_used = os.path.getmtime(paths[1])
+                size = sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+            except FileNotFoundError:
+                continue
+            entries.append((last_used, cache_key, size))
+            total_bytes += size
+
+        for _, cache_key, size in sorted(entries):
+            if total_bytes <= self.max_disk_bytes:
+                break
+            for name in (f"{cache_key}-alice", f"{cache_key}-bob"):
+                try:
+                    self.store.delete(name)
+                except FileNotFoundError:
+                    pass
+            total_bytes -= size
+            self.stats['evictions'] += 1
+
+    def clear(self):
+        self._memory.clear()
+        self.memory_bytes = 0
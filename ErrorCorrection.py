@@ -0,0 +1,195 @@
+from Keys import PackedKey, as_packed_key
+
+import math
+import time
+
+import numpy as np
+
+DEFAULT_CASCADE_PASSES = 4
+# first-pass block size k1 = CASCADE_BLOCK_FACTOR / QBER, doubled on every later pass
+CASCADE_BLOCK_FACTOR = 0.73
+MIN_CASCADE_BLOCK_SIZE = 8
+
+def cascade_block_sizes(qber, key_length, num_passes=DEFAULT_CASCADE_PASSES):
+    """Block size of each Cascade pass, adapted to the QBER and capped at the key length."""
+    if not 0 <= qber < 0.5:
+        raise ValueError("QBER must be in [0, 0.5) for Cascade to converge.")
+    key_length = max(key_length, 1)
+    first_block_size = key_length if qber == 0 else max(MIN_CASCADE_BLOCK_SIZE, math.ceil(CASCADE_BLOCK_FACTOR / qber))
+    return [min(first_block_size * 2**pass_index, key_length) for pass_index in range(num_passes)]
+
+# parity of every byte value, and the mask of the first r bits of a byte for r = 0..7
+_BYTE_PARITY = np.array([bin(value).count('1') & 1 for value in range(256)], dtype=np.uint8)
+_LEADING_BITS_MASK = np.array([(0xFF << (8 - num_bits)) & 0xFF for num_bits in range(8)], dtype=np.uint8)
+# permuted blocks are read this many positions at a time, bounding the temporary arrays
+PARITY_CHUNK_POSITIONS = 2**20
+
+def _packed_bits(packed, positions):
+    """Bits of the packed bytes at the given positions, as uint8 0/1 values."""
+    return (packed[positions >> 3] >> (7 - (positions & 7)).astype(np.uint8)) & 1
+
+def _flip_packed_bits(packed, positions):
+    np.bitwise_xor.at(packed, positions >> 3, (0x80 >> (positions & 7)).astype(np.uint8))
+
+class _ContiguousParities:
+    """Parities of bit ranges [lo, hi) of packed bytes, from prefix parities over whole bytes."""
+
+    def __init__(self, packed):
+        self.packed = np.append(packed, np.uint8(0))
+        self.prefix = np.zeros(len(self.packed) + 1, dtype=np.uint8)
+        np.bitwise_xor.accumulate(_BYTE_PARITY[self.packed], out=self.prefix[1:])
+
+    def _prefix_parity(self, stop):
+        byte_index = stop >> 3
+        return self.prefix[byte_index] ^ _BYTE_PARITY[self.packed[byte_index] & _LEADING_BITS_MASK[stop & 7]]
+
+    def __call__(self, lo, hi):
+        return self._prefix_parity(hi) ^ self._prefix_parity(lo)
+
+def _permuted_range_parities(errors, permutation, lo, hi):
+    """Parity of the error bits at permutation[lo:hi] for many disjoint ranges at once."""
+    lengths = hi - lo
+    segment_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    flat_positions = np.repeat(lo - segment_starts, lengths) + np.arange(lengths.sum())
+    # uint8 sums wrap modulo 256, which keeps their parity
+    return np.add.reduceat(_packed_bits(errors, permutation[flat_positions]), segment_starts) & 1
+
+def _permuted_block_parities(errors, permutation, block_size):
+    """Parity of every block of a permuted pass, read in chunks of whole blocks."""
+    chunk_positions = block_size * max(PARITY_CHUNK_POSITIONS // block_size, 1)
+    parities = []
+    for chunk_start in range(0, len(permutation), chunk_positions):
+        chunk_bits = _packed_bits(errors, permutation[chunk_start:chunk_start + chunk_positions])
+        parities.append(np.add.reduceat(chunk_bits, np.arange(0, len(chunk_bits), block_size)) & 1)
+    return np.concatenate(parities).astype(np.uint8)
+
+def _bisect_blocks(range_parities, lo, hi):
+    """Binary search of all odd-parity blocks [lo, hi) in parallel.
+
+    Each round discloses one parity per block still being searched. Returns the
+    pass positions of the erroneous bits found and the number of parities disclosed.
+    """
+    lo = lo.copy()
+    hi = hi.copy()
+    disclosed_parities = 0
+    while True:
+        searching = np.flatnonzero(hi - lo > 1)
+        if not searching.size:
+            return lo, disclosed_parities
+        block_lo = lo[searching]
+        block_hi = hi[searching]
+        mid = (block_lo + block_hi) // 2
+        left_half_odd = range_parities(block_lo, mid) == 1
+        disclosed_parities += searching.size
+        hi[searching] = np.where(left_half_odd, mid, block_hi)
+        lo[searching] = np.where(left_half_odd, block_lo, mid)
+
+def cascade(alice_key, bob_key, qber, num_passes=DEFAULT_CASCADE_PASSES, seed=None):
+    """Corrects bob_key towards alice_key with the Cascade protocol.
+
+    The error pattern, the XOR of the two keys, stays bit-packed throughout. The first
+    pass reads contiguous blocks through prefix parities of whole bytes; later passes
+    keep only their permutation, as int32 below 2^31 bits. Odd blocks are bisected in parallel, and after
+    each correction only the blocks of other passes that contain a flipped bit are
+    re-checked (the cascade step). Every disclosed parity counts as one leaked bit.
+    Returns the corrected key, leaked bits, block sizes, residual errors and throughput.
+    """
+    start_time = time.perf_counter()
+    alice_key = as_packed_key(alice_key)
+    bob_key = as_packed_key(bob_key)
+    if len(alice_key) != len(bob_key):
+        raise ValueError("Keys must be of the same length for error correction.")
+
+    key_length = len(alice_key)
+    block_sizes = cascade_block_sizes(qber, key_length, num_passes)
+    rng = np.random.default_rng(seed)
+
+    initial_errors = (alice_key ^ bob_key).packed
+    errors = initial_errors.copy()
+    leaked_bits = 0
+    passes = []
+
+    for pass_index in range(num_passes if key_length else 0):
+        block_size = block_sizes[pass_index]
+        if pass_index == 0:
+            permutation = None
+            block_starts = np.arange(0, key_length, block_size)
+            parity_mismatch = _ContiguousParities(errors)(
+                block_starts, np.minimum(block_starts + block_size, key_length)
+            )
+        else:
+            permutation = np.arange(key_length, dtype=np.int32 if key_length < 2**31 else np.int64)
+            rng.shuffle(permutation)
+            parity_mismatch = _permuted_block_parities(errors, permutation, block_size)
+        # a set entry means Alice's and Bob's parities of that block differ
+        leaked_bits += len(parity_mismatch)
+        passes.append((permutation, block_size, parity_mismatch))
+
+        blocks_to_check = {pass_index: np.flatnonzero(parity_mismatch)}
+        while blocks_to_check:
+            checked_pass = min(blocks_to_check)
+            candidates = np.unique(blocks_to_check.pop(checked_pass))
+            permutation, block_size, parity_mismatch = passes[checked_pass]
+            odd_blocks = candidates[parity_mismatch[candidates] == 1]
+            if not odd_blocks.size:
+                continue
+
+            block_lo = odd_blocks * block_size
+            block_hi = np.minimum(block_lo + block_size, key_length)
+            if permutation is None:
+                range_parities = _ContiguousParities(errors)
+            else:
+                range_parities = lambda lo, hi: _permuted_range_parities(errors, permutation, lo, hi)
+            error_positions, disclosed_parities = _bisect_blocks(range_parities, block_lo, block_hi)
+            leaked_bits += disclosed_parities
+
+            corrected_bits = error_positions if permutation is None else permutation[error_positions].astype(np.int64)
+            _flip_packed_bits(errors, corrected_bits)
+            # the flipped bits are distinct, so the set of their positions in a pass is all the cascade step needs
+            corrected = np.zeros(key_length, dtype=bool)
+            corrected[corrected_bits] = True
+            for other_pass, (other_permutation, other_block_size, other_mismatch) in enumerate(passes):
+                other_positions = corrected_bits if other_permutation is None else np.flatnonzero(corrected[other_permutation])
+                affected_blocks = other_positions // other_block_size
+                np.bitwise_xor.at(other_mismatch, affected_blocks, 1)
+                if other_pass != checked_pass:
+                    blocks_to_check[other_pass] = np.concatenate(
+                        (blocks_to_check.get(other_pass, np.zeros(0, dtype=np.int64)), affected_blocks)
+                    )
+
+    corrected_key = bob_key ^ PackedKey.from_packed(initial_errors ^ errors, key_length)
+    elapsed_s = time.perf_counter() - start_time
+
+    return {
+        'corrected_key': corrected_key,
+        'leaked_bits': leaked_bits,
+        'block_sizes': block_sizes,
+        'residual_errors': PackedKey.from_packed(errors, key_length).popcount(),
+        'elapsed_s': elapsed_s,
+        'throughput_mbps': key_length / elapsed_s / 1e6 if elapsed_s > 0 else float('inf'),
+    }
+
+def correct_link_keys(alice_node, bob_node, qber=None, num_passes=DEFAULT_CASCADE_PASSES, seed=None):
+    """Runs Cascade on the sifted keys two nodes share and stores Bob's corrected key.
+
+    alice_node's key is the reference. Without a qber, the QBER of the two keys is
+    used. The leaked bits are recorded on both nodes under each other's id.
+    """
+    from main import calculate_qber
+
+    alice_key = alice_node.shared_keys.get(bob_node.node_id)
+    bob_key = bob_node.shared_keys.get(alice_node.node_id)
+    if alice_key is None or bob_key is None:
+        raise ValueError(f"Nodes {alice_node.node_id} and {bob_node.node_id} do not share a sifted key.")
+
+    if qber is None:
+        qber, _ = calculate_qber(alice_key, bob_key)
+
+    result = cascade(alice_key, bob_key, qber, num_passes, seed)
+    bob_node.shared_keys[alice_node.node_id] = result['corrected_key']
+    alice_node.leaked_bits[bob_node.node_id] = alice_node.leaked_bits.get(bob_node.node_id, 0) + result['leaked_bits']
+    bob_node.leaked_bits[alice_node.node_id] = bob_node.leaked_bits.get(alice_node.node_id, 0) + result['leaked_bits']
+
+    print(f"Cascade between {alice_node.node_id} and {bob_node.node_id}: {result['leaked_bits']} bits leaked, "
+          f"{result['residual_errors']} residual errors, {result['throughput_mbps']:.1f} Mbit/s")
+    return result
@@ -1,11 +1,43 @@
 import random
 import math
+import heapq
+
+import numpy as np
+
+from Tracing import (TraceBuffer, TRACE_OFF, TRACE_COUNTERS, TRACE_SAMPLED, TRACE_FULL,
+                     DEFAULT_TRACE_CAPACITY, DEFAULT_TRACE_SAMPLE_EVERY, validate_trace_settings, record_to_dict)
+
+REFERENCE_WAVELENGTH_NM = 1550
+DEFAULT_AFTERPULSE_DECAY_NS = 50.0
+
+def fiber_attenuation_db_per_km(wavelength_nm, attenuation_at_reference_db_per_km=0.2):
+    """Scales the 1550 nm fiber attenuation to another wavelength with a Rayleigh (1/lambda^4) law."""
+    if wavelength_nm <= 0:
+        raise ValueError("Wavelength must be positive.")
+    return attenuation_at_reference_db_per_km * (REFERENCE_WAVELENGTH_NM / wavelength_nm)**4
 
 class OpticalChannel:
-    def __init__(self, distance_km, attenuation_db_per_km=0.2):
+    def __init__(self, distance_km, attenuation_db_per_km=0.2, num_splices=0, splice_loss_db=0.1,
+                 num_connectors=0, connector_loss_db=0.5, wavelength_nm=None, rng=None):
         self.distance_km = distance_km
         self.attenuation_db_per_km = attenuation_db_per_km
-        self.survival_probability = 10**(-(self.distance_km * self.attenuation_db_per_km) / 10)
+        self.num_splices = num_splices
+        self.splice_loss_db = splice_loss_db
+        self.num_connectors = num_connectors
+        self.connector_loss_db = connector_loss_db
+        self.wavelength_nm = wavelength_nm
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+        # attenuation_db_per_km is taken as the 1550 nm value when a wavelength is given
+        if wavelength_nm is None:
+            self.fiber_attenuation_db_per_km = attenuation_db_per_km
+        else:
+            self.fiber_attenuation_db_per_km = fiber_attenuation_db_per_km(wavelength_nm, attenuation_db_per_km)
+
+        self.total_loss_db = (self.distance_km * self.fiber_attenuation_db_per_km
+                              + self.num_splices * self.splice_loss_db
+                              + self.num_connectors * self.connector_loss_db)
+        self.survival_probability = 10**(-self.total_loss_db / 10)
 
     def transmit_pulse(self, photon_count):
         received_photons = 0
@@ -14,6 +46,11 @@ class OpticalChannel:
                 received_photons += 1
         return received_photons
 
+    def transmit_pulses(self, photon_counts, rng=None):
+        """Thins a whole array of photon counts with one binomial draw."""
+        rng = rng if rng is not None else self.rng
+        return rng.binomial(photon_counts, self.survival_probability)
+
 class MachZehnderInterferometer:
    
     def __init__(self, ideal_split_ratio=0.5):
@@ -35,16 +72,86 @@ class MachZehnderInterferometer:
         
         return prob_dm1, prob_dm2
 
+    def interfere_pulse_arrays(self, phases_n_minus_1, phases_n):
+        """Vectorized interfere_pulses over arrays of adjacent pulse phases."""
+        delta_phi = np.mod(np.subtract(phases_n, phases_n_minus_1), 2 * math.pi)
+        delta_phi = np.where(delta_phi > math.pi, delta_phi - 2 * math.pi, delta_phi)
+
+        prob_dm1 = np.cos(delta_phi / 2)**2
+        prob_dm2 = np.sin(delta_phi / 2)**2
+
+        return prob_dm1, prob_dm2
+
 class SinglePhotonDetector:
-    def __init__(self, quantum_efficiency=0.9, dark_count_rate_per_ns=1e-9, time_window_ns=1):
+    """Gated single-photon detector with optional dead time and afterpulsing; windows must be fed in time order."""
+
+    def __init__(self, quantum_efficiency=0.9, dark_count_rate_per_ns=1e-9, time_window_ns=1, rng=None,
+                 dead_time_ns=0.0, afterpulse_probability=0.0, afterpulse_decay_ns=DEFAULT_AFTERPULSE_DECAY_NS):
+        if dead_time_ns < 0:
+            raise ValueError("Dead time cannot be negative.")
+        if not 0 <= afterpulse_probability < 1:
+            raise ValueError("Afterpulse probability must be in [0, 1).")
+        if afterpulse_decay_ns <= 0:
+            raise ValueError("Afterpulse decay time must be positive.")
         self.quantum_efficiency = quantum_efficiency 
         self.dark_count_rate = dark_count_rate_per_ns
         self.time_window = time_window_ns 
+        self.dead_time_ns = dead_time_ns
+        self.afterpulse_probability = afterpulse_probability
+        self.afterpulse_decay_ns = afterpulse_decay_ns
         
         self.prob_dark_count_per_window = self.dark_count_rate * self.time_window
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.dark_count_clicks = 0
+        self.afterpulse_clicks = 0
+        self.suppressed_clicks = 0
+        self._blind_until_ns = -math.inf
+        self._pending_afterpulses_ns = []
+
+    @property
+    def has_memory(self):
+        """Whether a click changes later windows, i.e. dead time or afterpulsing is enabled."""
+        return self.dead_time_ns > 0 or self.afterpulse_probability > 0
+
+    def _apply_memory(self, times_ns, raw_clicks):
+        """Applies dead time and afterpulsing to the per-window clicks, visiting only click and afterpulse windows."""
+        clicks = np.zeros(len(times_ns), dtype=bool)
+        raw_click_windows = np.flatnonzero(raw_clicks).tolist()
+        next_raw = 0
+        pending = self._pending_afterpulses_ns
+
+        while True:
+            afterpulse_window = (int(np.searchsorted(times_ns, pending[0])) if pending else len(times_ns))
+            raw_window = raw_click_windows[next_raw] if next_raw < len(raw_click_windows) else len(times_ns)
+            window = min(raw_window, afterpulse_window)
+            if window == len(times_ns):
+                break
+            is_afterpulse = afterpulse_window < raw_window
+            if is_afterpulse:
+                heapq.heappop(pending)
+            else:
+                next_raw += 1
+
+            window_time_ns = times_ns[window]
+            if window_time_ns < self._blind_until_ns:
+                self.suppressed_clicks += 1
+                continue
+            if clicks[window]:
+                # an afterpulse and a raw click in the same window make one click
+                continue
+            clicks[window] = True
+            self.afterpulse_clicks += is_afterpulse
+            self._blind_until_ns = window_time_ns + self.dead_time_ns
+            if self.afterpulse_probability and self.rng.random() < self.afterpulse_probability:
+                heapq.heappush(pending, self._blind_until_ns + self.rng.exponential(self.afterpulse_decay_ns))
+        return clicks
 
-    def detect(self, incident_photons):
+    def detect(self, incident_photons, time_ns=None):
+        """Detects one window; time_ns, the window's start, is needed once the detector has memory."""
+        if self.has_memory and time_ns is None:
+            raise ValueError("Detectors with dead time or afterpulsing need the time of each window.")
         click = False
+        dark_click = False
         
         if incident_photons > 0:
             prob_actual_detection = 1 - (1 - self.quantum_efficiency)**incident_photons
@@ -54,30 +161,113 @@ class SinglePhotonDetector:
         if not click: 
              if random.random() < self.prob_dark_count_per_window:
                  click = True
-                 
+                 dark_click = True
+
+        if self.has_memory:
+            click = bool(self._apply_memory(np.array([time_ns], dtype=float), np.array([click]))[0])
+        self.dark_count_clicks += dark_click and click
         return click 
 
+    def detect_array(self, incident_photons, times_ns=None):
+        """Vectorized detect over an array of time windows; times_ns is needed once the detector has memory."""
+        if self.has_memory and times_ns is None:
+            raise ValueError("Detectors with dead time or afterpulsing need the time of each window.")
+        incident_photons = np.asarray(incident_photons)
+        prob_actual_detection = 1 - (1 - self.quantum_efficiency)**incident_photons
+        draws = self.rng.random(incident_photons.shape)
+
+        photon_clicks = draws < prob_actual_detection
+        dark_clicks = ~photon_clicks & (draws < prob_actual_detection
+                                        + (1 - prob_actual_detection) * self.prob_dark_count_per_window)
+        clicks = photon_clicks | dark_clicks
+        if self.has_memory:
+            clicks = self._apply_memory(np.asarray(times_ns, dtype=float), clicks)
+        # a dark count that falls in the dead time never registers
+        self.dark_count_clicks += int(np.count_nonzero(dark_clicks & clicks))
+        return clicks
+
+NO_CLICK = -1
+
+CLICK_RECORD_DTYPE = np.dtype([
+    ('time_slot', np.float64),
+    ('click_dm1', np.bool_),
+    ('click_dm2', np.bool_),
+    ('measured_phase_diff', np.float64),
+    ('bob_inferred_bit', np.int8),
+])
+
 class Receiver:
     
-    def __init__(self, detector_efficiency=0.9, dark_count_rate=1e-9):
+    def __init__(self, detector_efficiency=0.9, dark_count_rate=1e-9, rng=None, trace_level=TRACE_COUNTERS,
+                 trace_capacity=DEFAULT_TRACE_CAPACITY, trace_sample_every=DEFAULT_TRACE_SAMPLE_EVERY,
+                 dead_time_ns=0.0, afterpulse_probability=0.0, afterpulse_decay_ns=DEFAULT_AFTERPULSE_DECAY_NS):
+        validate_trace_settings(trace_level, trace_capacity, trace_sample_every)
+        self.rng = rng if rng is not None else np.random.default_rng()
         self.mzi = MachZehnderInterferometer()
-        self.detector_dm1 = SinglePhotonDetector(detector_efficiency, dark_count_rate)
-        self.detector_dm2 = SinglePhotonDetector(detector_efficiency, dark_count_rate)
-        self.raw_clicks_info = [] 
-        self.bob_raw_key_bits = [] 
+        detector_settings = {'dead_time_ns': dead_time_ns, 'afterpulse_probability': afterpulse_probability,
+                             'afterpulse_decay_ns': afterpulse_decay_ns}
+        self.detector_dm1 = SinglePhotonDetector(detector_efficiency, dark_count_rate, rng=self.rng, **detector_settings)
+        self.detector_dm2 = SinglePhotonDetector(detector_efficiency, dark_count_rate, rng=self.rng, **detector_settings)
+        self.trace_level = trace_level
+        self.trace_sample_every = trace_sample_every
+        self.counters = {'slots_measured': 0, 'clicks_dm1': 0, 'clicks_dm2': 0, 'double_clicks': 0}
+        self.trace = (TraceBuffer(CLICK_RECORD_DTYPE, trace_capacity)
+                      if trace_level in (TRACE_SAMPLED, TRACE_FULL) else None)
+        # a Storage.TraceWriter set here receives every traced slot, including those the ring evicts
+        self.trace_writer = None
+
+    @property
+    def raw_clicks_info(self):
+        """The traced slots as a list of dicts, oldest first, with None for slots without a click."""
+        if self.trace is None:
+            return []
+        clicks_info = []
+        for record in self.trace.to_array():
+            click_info = record_to_dict(record)
+            if click_info['bob_inferred_bit'] == NO_CLICK:
+                click_info['bob_inferred_bit'] = None
+                click_info['measured_phase_diff'] = None
+            clicks_info.append(click_info)
+        return clicks_info
+
+    def reset_trace(self):
+        self.counters = dict.fromkeys(self.counters, 0)
+        if self.trace is not None:
+            self.trace.clear()
+
+    def _record_measurements(self, columns, num_slots):
+        """Updates the counters and the trace for num_slots measurements given as column arrays."""
+        if self.trace_level == TRACE_OFF:
+            return
+        click_dm1 = np.asarray(columns['click_dm1'])
+        click_dm2 = np.asarray(columns['click_dm2'])
+        first_slot_number = self.counters['slots_measured']
+        self.counters['slots_measured'] += num_slots
+        self.counters['clicks_dm1'] += int(np.count_nonzero(click_dm1))
+        self.counters['clicks_dm2'] += int(np.count_nonzero(click_dm2))
+        self.counters['double_clicks'] += int(np.count_nonzero(click_dm1 & click_dm2))
+
+        if self.trace_level == TRACE_SAMPLED:
+            sampled = np.flatnonzero((first_slot_number + np.arange(num_slots)) % self.trace_sample_every == 0)
+            columns = {name: np.asarray(values)[sampled] for name, values in columns.items()}
+        if self.trace is not None:
+            self.trace.append_columns(columns)
+        if self.trace_writer is not None:
+            self.trace_writer.append(columns)
         
     def receive_and_measure(self, time_slot, current_pulse_photons, current_pulse_phase, 
                             previous_pulse_photons, previous_pulse_phase):
         
+        # also needed to resolve a double click made of dark counts alone
+        prob_dm1_ideal, prob_dm2_ideal = self.mzi.interfere_pulses(
+            previous_pulse_phase, current_pulse_phase
+        )
+
         if previous_pulse_photons == 0 or current_pulse_photons == 0:
             incident_photons_dm1_effective = 0
             incident_photons_dm2_effective = 0
         else:
-            prob_dm1_ideal, prob_dm2_ideal = self.mzi.interfere_pulses(
-                previous_pulse_phase, current_pulse_phase
-            )
-            
-            
+
             effective_incoming_photons = min(current_pulse_photons, previous_pulse_photons)
             if effective_incoming_photons > 0: 
                 incident_photons_dm1_effective = round(effective_incoming_photons * prob_dm1_ideal)
@@ -88,8 +278,8 @@ class Receiver:
 
 
         
-        click_dm1 = self.detector_dm1.detect(incident_photons_dm1_effective)
-        click_dm2 = self.detector_dm2.detect(incident_photons_dm2_effective)
+        click_dm1 = self.detector_dm1.detect(incident_photons_dm1_effective, time_slot)
+        click_dm2 = self.detector_dm2.detect(incident_photons_dm2_effective, time_slot)
 
         measured_phase_diff = None
         if click_dm1 and not click_dm2:
@@ -105,17 +295,59 @@ class Receiver:
             else:
                 measured_phase_diff = math.pi
                 bob_bit = 1
-            print(f"Warning: Ambiguous click at time {time_slot}. Both DM1 and DM2 clicked.")
         else: 
             measured_phase_diff = None
             bob_bit = None 
 
-        self.raw_clicks_info.append({
-            'time_slot': time_slot,
+        # double clicks are counted rather than reported one by one
+        self._record_measurements({
+            'time_slot': [time_slot],
+            'click_dm1': [click_dm1],
+            'click_dm2': [click_dm2],
+            'measured_phase_diff': [math.nan if measured_phase_diff is None else measured_phase_diff],
+            'bob_inferred_bit': [NO_CLICK if bob_bit is None else bob_bit]
+        }, 1)
+        
+        return click_dm1, click_dm2, measured_phase_diff, bob_bit
+
+    def measure_pulses(self, time_slots, received_photon_counts, modulated_phases,
+                       previous_pulse_photons=0, previous_pulse_phase=0.0):
+        """Batch counterpart of receive_and_measure over consecutive slots, returned as column arrays."""
+        current_photons = np.asarray(received_photon_counts)
+        current_phases = np.asarray(modulated_phases, dtype=float)
+
+        previous_photons = np.empty_like(current_photons)
+        previous_phases = np.empty_like(current_phases)
+        if current_photons.size:
+            previous_photons[0] = previous_pulse_photons
+            previous_photons[1:] = current_photons[:-1]
+            previous_phases[0] = previous_pulse_phase
+            previous_phases[1:] = current_phases[:-1]
+
+        prob_dm1_ideal, prob_dm2_ideal = self.mzi.interfere_pulse_arrays(previous_phases, current_phases)
+
+        # min() is already zero whenever either pulse lost all its photons
+        effective_incoming_photons = np.minimum(current_photons, previous_photons)
+        incident_photons_dm1_effective = np.rint(effective_incoming_photons * prob_dm1_ideal).astype(np.int64)
+        incident_photons_dm2_effective = np.rint(effective_incoming_photons * prob_dm2_ideal).astype(np.int64)
+
+        click_dm1 = self.detector_dm1.detect_array(incident_photons_dm1_effective, time_slots)
+        click_dm2 = self.detector_dm2.detect_array(incident_photons_dm2_effective, time_slots)
+
+        bob_bits = np.full(current_photons.shape, NO_CLICK, dtype=np.int8)
+        bob_bits[click_dm1 & ~click_dm2] = 0
+        bob_bits[click_dm2 & ~click_dm1] = 1
+        double_click = click_dm1 & click_dm2
+        bob_bits[double_click] = np.where(prob_dm1_ideal[double_click] > prob_dm2_ideal[double_click], 0, 1)
+
+        measured_phase_diff = np.where(bob_bits == NO_CLICK, np.nan, bob_bits * math.pi)
+
+        measurements = {
+            'time_slot': np.asarray(time_slots),
             'click_dm1': click_dm1,
             'click_dm2': click_dm2,
             'measured_phase_diff': measured_phase_diff,
-            'bob_inferred_bit': bob_bit
-        })
-        
-        return click_dm1, click_dm2, measured_phase_diff, bob_bit
+            'bob_inferred_bit': bob_bits
+        }
+        self._record_measurements(measurements, len(current_photons))
+        return measurements
@@ -0,0 +1,203 @@
+import numpy as np
+
+if hasattr(np, 'bitwise_count'):
+    def _popcount_bytes(data):
+        return int(np.bitwise_count(data).sum(dtype=np.int64))
+else:
+    _POPCOUNT_TABLE = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+    def _popcount_bytes(data):
+        return int(_POPCOUNT_TABLE[data].sum(dtype=np.int64))
+
+class PackedKey:
+    """A bit string stored eight bits per byte, most significant bit first.
+
+    Bits past the end of the key are always kept at zero, so XOR and popcount can
+    work on whole bytes. pop_prefix leaves the consumed bits of the first byte in
+    place behind a bit offset, which whole-byte operations shift out first.
+    """
+
+    def __init__(self, bits=None):
+        self._data = np.zeros(0, dtype=np.uint8)
+        self._length = 0
+        self._offset = 0
+        if bits is not None:
+            self.extend(bits)
+
+    @classmethod
+    def from_bits(cls, bits):
+        """Packs a sequence or array of 0/1 values."""
+        bits = np.asarray(bits, dtype=np.uint8)
+        return cls.from_packed(np.packbits(bits), len(bits))
+
+    @classmethod
+    def from_packed(cls, data, length):
+        """Wraps already packed bytes (any uint8 buffer, e.g. a memmap) without copying."""
+        data = np.asarray(data, dtype=np.uint8)
+        if length < 0 or len(data) * 8 < length:
+            raise ValueError("Packed data is too short for the requested key length.")
+        key = cls.__new__(cls)
+        key._data = data
+        key._length = length
+        key._offset = 0
+        return key
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def packed(self):
+        """The packed bytes of the key, as a read-only view."""
+        self._align()
+        view = self._data[:(self._length + 7) // 8].view()
+        view.flags.writeable = False
+        return view
+
+    @property
+    def nbytes(self):
+        return (self._length + 7) // 8
+
+    def to_bits(self):
+        """Unpacks the key into a uint8 array of 0/1 values."""
+        self._align()
+        return np.unpackbits(self._data[:self.nbytes], count=self._length)
+
+    def tolist(self):
+        return self.to_bits().tolist()
+
+    def tobytes(self):
+        self._align()
+        return self._data[:self.nbytes].tobytes()
+
+    def copy(self):
+        self._align()
+        return PackedKey.from_packed(self._data[:self.nbytes].copy(), self._length)
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._length)
+            if step != 1:
+                return PackedKey.from_bits(self.to_bits()[index])
+            stop = max(stop, start)
+            start += self._offset
+            stop += self._offset
+            if start % 8 == 0:
+                data = self._data[start // 8:(stop + 7) // 8].copy()
+                _clear_tail(data, stop - start)
+                return PackedKey.from_packed(data, stop - start)
+            first_byte = start // 8
+            bits = np.unpackbits(self._data[first_byte:(stop + 7) // 8])
+            return PackedKey.from_bits(bits[start - 8 * first_byte:stop - 8 * first_byte])
+
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("PackedKey index out of range.")
+        index += self._offset
+        return int((self._data[index // 8] >> (7 - index % 8)) & 1)
+
+    def pop_prefix(self, num_bits):
+        """Removes and returns the first num_bits of the key.
+
+        Costs O(num_bits): the remaining bits stay where they are, behind a bit offset.
+        """
+        if not 0 <= num_bits <= self._length:
+            raise ValueError(f"Cannot take {num_bits} bits from a key of {self._length} bits.")
+        prefix = self[:num_bits]
+        first_bit = self._offset + num_bits
+        self._data = self._data[first_bit // 8:]
+        self._offset = first_bit % 8
+        self._length -= num_bits
+        return prefix
+
+    def _align(self):
+        """Shifts the key back to the start of its first byte after pop_prefix."""
+        if not self._offset:
+            return
+        nbytes = self.nbytes
+        data = np.zeros(nbytes + 1, dtype=np.uint8)
+        raw_bytes = (self._offset + self._length + 7) // 8
+        data[:raw_bytes] = self._data[:raw_bytes]
+        aligned = (data[:-1] << self._offset) | (data[1:] >> (8 - self._offset))
+        _clear_tail(aligned, self._length)
+        self._data = aligned
+        self._offset = 0
+
+    def _reserve(self, num_bits):
+        self._align()
+        needed_bytes = (num_bits + 7) // 8
+        if needed_bytes > len(self._data) or not self._data.flags.writeable:
+            capacity = max(needed_bytes, 2 * len(self._data), 64)
+            data = np.zeros(capacity, dtype=np.uint8)
+            data[:self.nbytes] = self._data[:self.nbytes]
+            self._data = data
+
+    def append(self, bit):
+        self._reserve(self._length + 1)
+        if bit:
+            self._data[self._length // 8] |= np.uint8(0x80 >> (self._length % 8))
+        self._length += 1
+
+    def extend(self, bits):
+        """Appends another PackedKey or a sequence of 0/1 values."""
+        other = bits if isinstance(bits, PackedKey) else PackedKey.from_bits(bits)
+        if not len(other):
+            return
+        other._align()
+        other_data = other._data[:other.nbytes]
+
+        self._reserve(self._length + len(other))
+        first_byte = self._length // 8
+        shift = self._length % 8
+        if shift == 0:
+            self._data[first_byte:first_byte + len(other_data)] = other_data
+        else:
+            # spread each source byte over the partial last byte and the one after it
+            self._data[first_byte] |= other_data[0] >> shift
+            spill = other_data << (8 - shift)
+            spill[:-1] |= other_data[1:] >> shift
+            end_byte = min(first_byte + 1 + len(spill), len(self._data))
+            self._data[first_byte + 1:end_byte] = spill[:end_byte - first_byte - 1]
+        self._length += len(other)
+        _clear_tail(self._data[:self.nbytes], self._length)
+
+    def __xor__(self, other):
+        other = other if isinstance(other, PackedKey) else PackedKey.from_bits(other)
+        if len(other) != self._length:
+            raise ValueError("Keys must be of the same length to XOR them.")
+        self._align()
+        other._align()
+        return PackedKey.from_packed(np.bitwise_xor(self._data[:self.nbytes], other._data[:other.nbytes]),
+                                     self._length)
+
+    def popcount(self):
+        """Number of 1 bits in the key."""
+        self._align()
+        return _popcount_bytes(self._data[:self.nbytes])
+
+    def __eq__(self, other):
+        if isinstance(other, PackedKey):
+            self._align()
+            other._align()
+            return self._length == len(other) and np.array_equal(self._data[:self.nbytes],
+                                                                 other._data[:other.nbytes])
+        if isinstance(other, (list, tuple, np.ndarray)):
+            return self.tolist() == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        preview = ''.join(str(bit) for bit in self[:32])
+        return f"PackedKey(length={self._length}, bits={preview}{'...' if self._length > 32 else ''})"
+
+def _clear_tail(data, num_bits):
+    """Zeroes the bits of data past num_bits in place."""
+    if num_bits % 8 and len(data):
+        data[num_bits // 8] &= np.uint8((0xFF << (8 - num_bits % 8)) & 0xFF)
+    data[(num_bits + 7) // 8:] = 0
+
+def as_packed_key(key):
+    """Returns key as a PackedKey, packing lists and arrays of bits."""
+    return key if isinstance(key, PackedKey) else PackedKey.from_bits(key)
@@ -0,0 +1,117 @@
+import contextlib
+import json
+import time
+from collections import defaultdict
+
+# a node is credited only with the side of a link session it runs; link and run scopes keep everything
+SENDER_COUNTERS = ('pulses', 'photons_sent')
+RECEIVER_COUNTERS = ('photons_surviving', 'clicks_dm1', 'clicks_dm2', 'double_clicks', 'dark_count_clicks')
+SHARED_COUNTERS = ('sessions', 'sifted_bits', 'cache_hits')
+COUNTER_NAMES = SENDER_COUNTERS + RECEIVER_COUNTERS + SHARED_COUNTERS
+
+SENDER_STAGES = ('preparation', 'transmission')
+RECEIVER_STAGES = ('measurement',)
+SHARED_STAGES = ('sifting', 'sampling')
+STAGE_NAMES = SENDER_STAGES + RECEIVER_STAGES + SHARED_STAGES
+
+ROLES = {
+    'sender': (SENDER_COUNTERS + SHARED_COUNTERS, SENDER_STAGES + SHARED_STAGES),
+    'receiver': (RECEIVER_COUNTERS + SHARED_COUNTERS, RECEIVER_STAGES + SHARED_STAGES),
+}
+
+class StageMetrics:
+    """Counters, per-stage timers and total elapsed time for one scope: a node, a link or a run."""
+
+    def __init__(self, **labels):
+        self.labels = labels
+        self.counters = defaultdict(int)
+        self.stage_seconds = defaultdict(float)
+        self.elapsed_s = 0.0
+
+    def increment(self, name, value=1):
+        if name not in COUNTER_NAMES:
+            raise ValueError(f"Unknown counter '{name}'. Expected one of {COUNTER_NAMES}.")
+        self.counters[name] += int(value)
+
+    @contextlib.contextmanager
+    def time_stage(self, stage):
+        if stage not in STAGE_NAMES:
+            raise ValueError(f"Unknown stage '{stage}'. Expected one of {STAGE_NAMES}.")
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds[stage] += time.perf_counter() - start_time
+
+    @contextlib.contextmanager
+    def time_elapsed(self):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.elapsed_s += time.perf_counter() - start_time
+
+    def merge(self, other, include_elapsed=True, role=None):
+        """Adds the counters and timings of other into this scope.
+
+        With a role ('sender' or 'receiver'), only the counters and stages of that side
+        of a link session are added.
+        """
+        if role is not None and role not in ROLES:
+            raise ValueError(f"Unknown role '{role}'. Expected one of {tuple(ROLES)}.")
+        counter_names, stage_names = ROLES[role] if role is not None else (COUNTER_NAMES, STAGE_NAMES)
+        for name, value in other.counters.items():
+            if name in counter_names:
+                self.counters[name] += value
+        for stage, seconds in other.stage_seconds.items():
+            if stage in stage_names:
+                self.stage_seconds[stage] += seconds
+        if include_elapsed:
+            self.elapsed_s += other.elapsed_s
+
+    def as_dict(self):
+        return {
+            'labels': dict(self.labels),
+            'counters': dict(self.counters),
+            'stage_seconds': dict(self.stage_seconds),
+            'elapsed_s': self.elapsed_s,
+        }
+
+def metrics_to_json(snapshot, indent=2):
+    """Serializes a metrics snapshot (nested dicts of StageMetrics.as_dict()) as JSON."""
+    return json.dumps(snapshot, indent=indent, sort_keys=True)
+
+def _prometheus_labels(labels, **extra_labels):
+    labels = dict(labels, **extra_labels)
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+def metrics_to_prometheus(scopes, prefix='qkd'):
+    """Renders StageMetrics (or their as_dict() form) in the Prometheus text exposition format.
+
+    scopes maps a scope name ('node', 'link', 'run') to its metrics. Each scope gets
+    its own metric families, e.g. qkd_node_pulses_total and qkd_link_pulses_total,
+    since a link session is counted once per link, once per node and once per run,
+    and a sum across scopes would count it several times.
+    """
+    samples = defaultdict(list)
+    for scope_name, scope_metrics in scopes.items():
+        for metrics in scope_metrics:
+            metrics = metrics.as_dict() if isinstance(metrics, StageMetrics) else metrics
+            labels = metrics['labels']
+            for name, value in sorted(metrics['counters'].items()):
+                samples[(f'{prefix}_{scope_name}_{name}_total', 'counter')].append(
+                    f"{_prometheus_labels(labels)} {value}")
+            for stage, seconds in sorted(metrics['stage_seconds'].items()):
+                samples[(f'{prefix}_{scope_name}_stage_seconds_total', 'counter')].append(
+                    f"{_prometheus_labels(labels, stage=stage)} {seconds:.9g}")
+            samples[(f'{prefix}_{scope_name}_elapsed_seconds_total', 'counter')].append(
+                f"{_prometheus_labels(labels)} {metrics['elapsed_s']:.9g}")
+
+    lines = []
+    for (metric_name, metric_type), metric_samples in samples.items():
+        lines.append(f"# TYPE {metric_name} {metric_type}")
+        lines.extend(metric_name + sample for sample in metric_samples)
+    return '\n'.join(lines) + '\n'
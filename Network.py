@@ -1,108 +1,264 @@
 
-from Source import Sender
-from Hardware import Receiver, OpticalChannel
-
+from Source import Sender, SENT_PULSE_DTYPE
+from Hardware import Receiver, OpticalChannel, NO_CLICK, DEFAULT_AFTERPULSE_DECAY_NS, CLICK_RECORD_DTYPE
+from Keys import PackedKey
+from Sampling import sample_sifted_keys_event_skipping
+from Tracing import TRACE_OFF, TRACE_COUNTERS, DEFAULT_TRACE_CAPACITY, DEFAULT_TRACE_SAMPLE_EVERY
+from Metrics import StageMetrics, metrics_to_json, metrics_to_prometheus
+from Topology import Topology
+from Analytics import estimate_link
+from Cache import link_cache_key, seed_identity
+from Storage import TraceWriter
+
+import copy
 import math 
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+SAMPLING_MODES = ('full', 'event_skipping')
+
+def sift_keys(alice_modulated_phases, bob_inferred_bits, previous_alice_phase=None):
+    """Sifts a run of consecutive slots in O(N), pairing Alice's pulses i-1 and i with Bob's slot i."""
+    alice_modulated_phases = np.asarray(alice_modulated_phases, dtype=float)
+    bob_inferred_bits = np.asarray(bob_inferred_bits)
+
+    if previous_alice_phase is None:
+        previous_phases = alice_modulated_phases[:-1]
+        first_index = 1
+    else:
+        previous_phases = np.concatenate(([previous_alice_phase], alice_modulated_phases[:-1]))
+        first_index = 0
+
+    sifted_indices = np.flatnonzero(bob_inferred_bits[first_index:] != NO_CLICK) + first_index
+
+    alice_intended_delta_phi = np.mod(alice_modulated_phases[sifted_indices]
+                                      - previous_phases[sifted_indices - first_index], 2 * math.pi)
+    alice_intended_delta_phi = np.where(alice_intended_delta_phi > math.pi,
+                                        alice_intended_delta_phi - 2 * math.pi, alice_intended_delta_phi)
+
+    alice_sifted_bits = np.where(np.abs(alice_intended_delta_phi) <= 1e-9, 0, 1).astype(np.int8)
+    bob_sifted_bits = bob_inferred_bits[sifted_indices].astype(np.int8)
+
+    return alice_sifted_bits, bob_sifted_bits, sifted_indices
 
 class Node:
     
-    def __init__(self, node_id, avg_photon_number=0.2, detector_efficiency=0.9, dark_count_rate=1e-9):
+    def __init__(self, node_id, avg_photon_number=0.2, detector_efficiency=0.9, dark_count_rate=1e-9,
+                 trace_level=TRACE_COUNTERS, trace_capacity=DEFAULT_TRACE_CAPACITY,
+                 trace_sample_every=DEFAULT_TRACE_SAMPLE_EVERY, dead_time_ns=0.0, afterpulse_probability=0.0,
+                 afterpulse_decay_ns=DEFAULT_AFTERPULSE_DECAY_NS):
         self.node_id = node_id
-        self.qkd_sender = Sender(avg_photon_number)
-        self.qkd_receiver = Receiver(detector_efficiency, dark_count_rate)
+        self.trace_settings = {
+            'trace_level': trace_level,
+            'trace_capacity': trace_capacity,
+            'trace_sample_every': trace_sample_every,
+        }
+        self.detector_settings = {
+            'dead_time_ns': dead_time_ns,
+            'afterpulse_probability': afterpulse_probability,
+            'afterpulse_decay_ns': afterpulse_decay_ns,
+        }
+        self.qkd_sender = Sender(avg_photon_number, **self.trace_settings)
+        self.qkd_receiver = Receiver(detector_efficiency, dark_count_rate, **self.trace_settings,
+                                     **self.detector_settings)
         self.connected_links = {}
         self.shared_keys = {}     
         self.traffic_log = []    
+        # bits disclosed to an eavesdropper during error correction, keyed by neighbor
+        self.leaked_bits = {}
+        self.secret_keys = {}
+        # link key bits used up by one-time-pad relaying, keyed by neighbor
+        self.key_consumed = {}
+        self.end_to_end_keys = {}
+        # node totals cover every session the node took part in, on either end;
+        # link totals cover the sessions this node initiated, keyed by neighbor
+        self.metrics = StageMetrics(node=node_id)
+        self.link_metrics = {}
+        self.last_session_metrics = None
 
     def add_link(self, neighbor_node_id, channel_instance):
      
         self.connected_links[neighbor_node_id] = channel_instance
 
-    def generate_and_share_key(self, target_node, num_pulses, pulse_repetition_rate_ns):
+    def generate_and_share_key(self, target_node, num_pulses, pulse_repetition_rate_ns, chunk_size=None, seed=None,
+                               sampling='full', cache=None, key_store=None, trace_directory=None):
+        """Runs a QKD session with target_node and stores the sifted keys on both nodes."""
         
         print(f"--- Node {self.node_id} initiating QKD with Node {target_node.node_id} ---")
         
+        session_metrics = StageMetrics(link=f"{self.node_id}->{target_node.node_id}")
+
+        if sampling not in SAMPLING_MODES:
+            raise ValueError(f"Unknown sampling mode '{sampling}'. Expected one of {SAMPLING_MODES}.")
+        if chunk_size is not None and chunk_size <= 0:
+            raise ValueError("Chunk size must be a positive number of pulses.")
         
-        self.qkd_sender = Sender(self.qkd_sender.light_source.mu)
+        rng = np.random.default_rng(seed)
+        self.qkd_sender = Sender(self.qkd_sender.light_source.mu, rng=rng, **self.trace_settings)
         target_node.qkd_receiver = Receiver(target_node.qkd_receiver.detector_dm1.quantum_efficiency,
-                                        target_node.qkd_receiver.detector_dm1.dark_count_rate)
+                                        target_node.qkd_receiver.detector_dm1.dark_count_rate, rng=rng,
+                                        **target_node.trace_settings, **target_node.detector_settings)
 
-        alice_pulses_sent_info = [] 
-        previous_pulse_actual_phase = self.qkd_sender.light_source.get_initial_phase() 
-
-        for i in range(num_pulses):
-            time_slot = i * pulse_repetition_rate_ns
-            modulated_phase, photon_count = self.qkd_sender.prepare_and_send_pulse(time_slot, previous_pulse_actual_phase)
-            alice_pulses_sent_info.append(self.qkd_sender.get_pulse_info(time_slot)) 
-            previous_pulse_actual_phase = modulated_phase 
-
-        
         channel = self.connected_links.get(target_node.node_id)
         if not channel:
             raise ValueError(f"No channel defined between {self.node_id} and {target_node.node_id}")
 
-        channel_processed_pulses = []
-        for pulse in alice_pulses_sent_info:
-            received_photons = channel.transmit_pulse(pulse['photon_count'])
-            channel_processed_pulses.append({
-                'time_slot': pulse['time_slot'],
-                'received_photon_count': received_photons,
-                'modulated_phase': pulse['modulated_phase'] 
-            })
+        if trace_directory is not None:
+            if sampling == 'event_skipping':
+                raise ValueError("Event-skipping sampling keeps no per-slot trace; use sampling='full' to stream one.")
+            if self.qkd_sender.trace is None or target_node.qkd_receiver.trace is None:
+                raise ValueError("Streaming traces needs trace_level 'sampled' or 'full' on both nodes.")
+            link_directory = os.path.join(trace_directory, f"{self.node_id}--{target_node.node_id}")
+            self.qkd_sender.trace_writer = TraceWriter(os.path.join(link_directory, 'sender'), SENT_PULSE_DTYPE)
+            target_node.qkd_receiver.trace_writer = TraceWriter(os.path.join(link_directory, 'receiver'),
+                                                                CLICK_RECORD_DTYPE)
+
+        sifted_keys = None
+        if key_store is not None:
+            sifted_keys = tuple(
+                key_store.writer(f"{node_id}--{neighbor_id}", {'node': node_id, 'neighbor': neighbor_id})
+                for node_id, neighbor_id in ((self.node_id, target_node.node_id), (target_node.node_id, self.node_id))
+            )
 
+        cache_key = None
+        if cache is not None:
+            cache_key = self.link_cache_key(target_node, num_pulses, pulse_repetition_rate_ns, chunk_size, seed,
+                                            sampling)
+            cached = cache.get(cache_key) if cache_key is not None else None
+            if cached is not None:
+                session_metrics.counters.update(cached['counters'])
+                session_metrics.increment('cache_hits')
+                print(f"Sifting complete (cached). Raw key length: {len(cached['alice'])}")
+                alice_sifted_key, bob_sifted_key = cached['alice'], cached['bob']
+                if sifted_keys is not None:
+                    sifted_keys[0].extend(alice_sifted_key)
+                    sifted_keys[1].extend(bob_sifted_key)
+                    alice_sifted_key, bob_sifted_key = _close_key_writers(key_store, sifted_keys)
+                return self.record_key_session(target_node, alice_sifted_key, bob_sifted_key, num_pulses,
+                                               session_metrics)
+
+        with session_metrics.time_elapsed():
+            if sampling == 'event_skipping':
+                with session_metrics.time_stage('sampling'):
+                    alice_sifted_key, bob_sifted_key = sample_sifted_keys_event_skipping(
+                        self.qkd_sender.light_source, channel, target_node.qkd_receiver, num_pulses, rng,
+                        window_size=chunk_size, metrics=session_metrics, sifted_keys=sifted_keys
+                    )
+            else:
+                alice_sifted_key, bob_sifted_key = self._simulate_pulse_chunks(
+                    target_node, channel, num_pulses, pulse_repetition_rate_ns, chunk_size or max(num_pulses, 1), rng,
+                    session_metrics, sifted_keys=sifted_keys
+                )
+        if trace_directory is not None:
+            for traced_end in (self.qkd_sender, target_node.qkd_receiver):
+                traced_end.trace_writer.close()
+                traced_end.trace_writer = None
+        if sifted_keys is not None:
+            alice_sifted_key, bob_sifted_key = _close_key_writers(key_store, sifted_keys)
+        session_metrics.increment('sessions')
+        session_metrics.increment('pulses', num_pulses)
+        session_metrics.increment('sifted_bits', len(alice_sifted_key))
+                
+        print(f"Sifting complete. Raw key length: {len(alice_sifted_key)}")
 
-        bob_clicks_and_inferred_bits = []
-        
-        dummy_prev_received_pulse = {'received_photon_count': 0, 'modulated_phase': 0.0}
+        if cache_key is not None:
+            cache.put(cache_key, alice_sifted_key, bob_sifted_key, session_metrics.counters)
+        return self.record_key_session(target_node, alice_sifted_key, bob_sifted_key, num_pulses, session_metrics)
 
-        for i in range(len(channel_processed_pulses)):
-            current_received_pulse = channel_processed_pulses[i]
-            
-            previous_received_pulse_for_mzi = dummy_prev_received_pulse if i == 0 else channel_processed_pulses[i-1]
-
-            click_dm1, click_dm2, measured_phase_diff, bob_bit = target_node.qkd_receiver.receive_and_measure(
-                current_received_pulse['time_slot'],
-                current_received_pulse['received_photon_count'],
-                current_received_pulse['modulated_phase'],
-                previous_received_pulse_for_mzi['received_photon_count'],
-                previous_received_pulse_for_mzi['modulated_phase']
-            )
-            bob_clicks_and_inferred_bits.append({
-                'time_slot': current_received_pulse['time_slot'],
-                'click_dm1': click_dm1,
-                'click_dm2': click_dm2,
-                'measured_phase_diff': measured_phase_diff,
-                'bob_inferred_bit': bob_bit 
-            })
-
-        alice_sifted_key = []
-        bob_sifted_key = []
-        sifted_time_slots = []
-        
-        for i in range(1, len(alice_pulses_sent_info)):
-            alice_pn_minus_1_info = alice_pulses_sent_info[i-1]
-            alice_pn_info = alice_pulses_sent_info[i]
-            
-            bob_measurement_info_for_pn = None
-            for click_info in bob_clicks_and_inferred_bits:
-                if click_info['time_slot'] == alice_pn_info['time_slot']: 
-                    bob_measurement_info_for_pn = click_info
-                    break
+    def link_cache_key(self, target_node, num_pulses, pulse_repetition_rate_ns, chunk_size, seed, sampling):
+        """Cache address of a session with target_node, or None when its result cannot be reused."""
+        channel = self.connected_links.get(target_node.node_id)
+        seed_id = seed_identity(seed)
+        if channel is None or seed_id is None:
+            return None
+        if {self.trace_settings['trace_level'], target_node.trace_settings['trace_level']} - {TRACE_OFF, TRACE_COUNTERS}:
+            return None
 
-            if bob_measurement_info_for_pn and bob_measurement_info_for_pn['bob_inferred_bit'] is not None:
+        detector = target_node.qkd_receiver.detector_dm1
+        return link_cache_key({
+            'mu': self.qkd_sender.light_source.mu,
+            'total_loss_db': channel.total_loss_db,
+            'detector_efficiency': detector.quantum_efficiency,
+            'dark_count_rate_per_ns': detector.dark_count_rate,
+            'time_window_ns': detector.time_window,
+            'dead_time_ns': detector.dead_time_ns,
+            'afterpulse_probability': detector.afterpulse_probability,
+            'afterpulse_decay_ns': detector.afterpulse_decay_ns,
+            'num_pulses': num_pulses,
+            'pulse_repetition_rate_ns': pulse_repetition_rate_ns,
+            'chunk_size': chunk_size,
+            'sampling': sampling,
+            'seed': seed_id,
+        })
 
-                alice_intended_delta_phi = (alice_pn_info['modulated_phase'] - alice_pn_minus_1_info['modulated_phase']) % (2 * math.pi)
+    def _simulate_pulse_chunks(self, target_node, channel, num_pulses, pulse_repetition_rate_ns, chunk_size, rng,
+                               metrics, sifted_keys=None):
+        """Runs every pulse through source, channel, receiver and sifting, one chunk at a time."""
+        alice_sifted_key, bob_sifted_key = sifted_keys if sifted_keys is not None else (PackedKey(), PackedKey())
+
+        # the pulse before the first slot is an empty dummy, as in the per-slot receiver;
+        # afterwards it is the last pulse of the previous chunk
+        previous_received_photons = 0
+        previous_pulse_phase = None
+
+        for start_index in range(0, num_pulses, chunk_size):
+            pulses_in_chunk = min(chunk_size, num_pulses - start_index)
+
+            with metrics.time_stage('preparation'):
+                alice_pulses_sent_info = self.qkd_sender.prepare_pulses(
+                    pulses_in_chunk, pulse_repetition_rate_ns, start_index=start_index
+                )
+
+            with metrics.time_stage('transmission'):
+                received_photon_counts = channel.transmit_pulses(alice_pulses_sent_info['photon_count'], rng=rng)
+
+            with metrics.time_stage('measurement'):
+                bob_clicks_and_inferred_bits = target_node.qkd_receiver.measure_pulses(
+                    alice_pulses_sent_info['time_slot'],
+                    received_photon_counts,
+                    alice_pulses_sent_info['modulated_phase'],
+                    previous_pulse_photons=previous_received_photons,
+                    previous_pulse_phase=0.0 if previous_pulse_phase is None else previous_pulse_phase
+                )
+
+            with metrics.time_stage('sifting'):
+                alice_sifted_bits, bob_sifted_bits, _ = sift_keys(
+                    alice_pulses_sent_info['modulated_phase'],
+                    bob_clicks_and_inferred_bits['bob_inferred_bit'],
+                    previous_alice_phase=previous_pulse_phase
+                )
+                alice_sifted_key.extend(alice_sifted_bits)
+                bob_sifted_key.extend(bob_sifted_bits)
+
+            click_dm1 = bob_clicks_and_inferred_bits['click_dm1']
+            click_dm2 = bob_clicks_and_inferred_bits['click_dm2']
+            metrics.increment('photons_sent', np.sum(alice_pulses_sent_info['photon_count']))
+            metrics.increment('photons_surviving', np.sum(received_photon_counts))
+            metrics.increment('clicks_dm1', np.count_nonzero(click_dm1))
+            metrics.increment('clicks_dm2', np.count_nonzero(click_dm2))
+            metrics.increment('double_clicks', np.count_nonzero(click_dm1 & click_dm2))
+
+            previous_received_photons = received_photon_counts[-1]
+            previous_pulse_phase = alice_pulses_sent_info['modulated_phase'][-1]
+
+        receiver = target_node.qkd_receiver
+        metrics.increment('dark_count_clicks',
+                          receiver.detector_dm1.dark_count_clicks + receiver.detector_dm2.dark_count_clicks)
 
-                if alice_intended_delta_phi > math.pi: alice_intended_delta_phi -= 2 * math.pi
-                if alice_intended_delta_phi < -math.pi: alice_intended_delta_phi += 2 * math.pi
+        return alice_sifted_key, bob_sifted_key
 
-                alice_intended_bit = 0 if math.isclose(alice_intended_delta_phi, 0.0, abs_tol=1e-9) else 1
-                
-                alice_sifted_key.append(alice_intended_bit)
-                bob_sifted_key.append(bob_measurement_info_for_pn['bob_inferred_bit'])
-                sifted_time_slots.append(bob_measurement_info_for_pn['time_slot'])
-                
-        print(f"Sifting complete. Raw key length: {len(alice_sifted_key)}")
+    def record_key_session(self, target_node, alice_sifted_key, bob_sifted_key, num_pulses, session_metrics=None):
+        """Stores the sifted keys and metrics of a session with target_node on both nodes and logs it."""
+        if session_metrics is not None:
+            self.last_session_metrics = session_metrics
+            self.metrics.merge(session_metrics, role='sender')
+            target_node.metrics.merge(session_metrics, role='receiver')
+            link_metrics = self.link_metrics.setdefault(
+                target_node.node_id, StageMetrics(link=f"{self.node_id}->{target_node.node_id}")
+            )
+            link_metrics.merge(session_metrics)
 
         self.shared_keys[target_node.node_id] = alice_sifted_key
         target_node.shared_keys[self.node_id] = bob_sifted_key 
@@ -121,74 +277,234 @@ class Node:
         """Retrieves the raw sifted key shared with a direct neighbor."""
         return self.shared_keys.get(neighbor_id)
 
-    def relay_key_classically(self, sender_node_id, receiver_node_id, key_to_relay):
+    def consume_key_with_neighbor(self, neighbor_id, num_bits):
+        """Removes and returns the first num_bits of the key shared with a neighbor, in O(num_bits)."""
+        key = self.shared_keys.get(neighbor_id)
+        if key is None or len(key) < num_bits:
+            raise ValueError(f"Node {self.node_id} holds fewer than {num_bits} key bits with {neighbor_id}.")
+        self.key_consumed[neighbor_id] = self.key_consumed.get(neighbor_id, 0) + num_bits
+        return key.pop_prefix(num_bits)
 
+    def relay_key_classically(self, sender_node_id, receiver_node_id, key_to_relay):
+        """One-time-pad hop of a trusted relay: decrypts with the previous-hop key, re-encrypts with the next."""
         key_with_sender = self.get_raw_sifted_key_with_neighbor(sender_node_id)
         key_with_receiver = self.get_raw_sifted_key_with_neighbor(receiver_node_id)
 
-        if not key_with_sender:
-            print(f"Error: Node {self.node_id} does not have a key with {sender_node_id} to relay.")
+        if key_with_sender is None or len(key_with_sender) < len(key_to_relay):
+            print(f"Error: Node {self.node_id} does not have enough key with {sender_node_id} to relay.")
             return None
-        if not key_with_receiver:
-            print(f"Error: Node {self.node_id} does not have a key with {receiver_node_id} to relay.")
+        if key_with_receiver is None or len(key_with_receiver) < len(key_to_relay):
+            print(f"Error: Node {self.node_id} does not have enough key with {receiver_node_id} to relay.")
             return None
-        print(f"Node {self.node_id} (relay) is holding the end-to-end key segment. Ready to extend to {receiver_node_id}.")
-        return key_to_relay
+
+        plaintext = key_to_relay ^ self.consume_key_with_neighbor(sender_node_id, len(key_to_relay))
+        self.traffic_log.append({'type': 'key_relay', 'from': sender_node_id, 'to': receiver_node_id,
+                                 'relayed_bits': len(key_to_relay)})
+        return plaintext ^ self.consume_key_with_neighbor(receiver_node_id, len(key_to_relay))
+
+def _close_key_writers(key_store, key_writers):
+    """Closes the KeyWriters of a session and opens the keys they wrote as memory-mapped PackedKeys."""
+    for key_writer in key_writers:
+        key_writer.close()
+    return tuple(key_store.open(key_writer.name) for key_writer in key_writers)
+
+def _detached_link_copy(node, neighbor_id):
+    """Shallow copy of a node carrying only what one link session needs, for shipping to a worker."""
+    detached = copy.copy(node)
+    detached.shared_keys = {}
+    detached.traffic_log = []
+    detached.metrics = StageMetrics(node=node.node_id)
+    detached.link_metrics = {}
+    detached.connected_links = {neighbor_id: node.connected_links[neighbor_id]} if neighbor_id in node.connected_links else {}
+    return detached
+
+def _run_link_session(node1, node2, num_pulses, pulse_repetition_rate_ns, chunk_size, seed, sampling):
+    """Worker entry point: runs one link session on detached node copies, returning its keys and metrics."""
+    alice_sifted_key, bob_sifted_key = node1.generate_and_share_key(
+        node2, num_pulses, pulse_repetition_rate_ns, chunk_size=chunk_size, seed=seed, sampling=sampling
+    )
+    return alice_sifted_key, bob_sifted_key, node1.last_session_metrics
 
 class Network:
     def __init__(self):
         self.nodes = {} 
+        self.run_metrics = []
+        self.topology = Topology()
 
     def add_node(self, node_id, **kwargs):
         
         if node_id in self.nodes:
             raise ValueError(f"Node {node_id} already exists.")
         self.nodes[node_id] = Node(node_id, **kwargs)
+        self.topology.add_node(node_id)
         return self.nodes[node_id]
 
-    def connect_nodes(self, node1_id, node2_id, distance_km, attenuation_db_per_km=0.2):
+    def connect_nodes(self, node1_id, node2_id, distance_km, attenuation_db_per_km=0.2, **channel_kwargs):
         node1 = self.nodes.get(node1_id)
         node2 = self.nodes.get(node2_id)
 
         if not node1 or not node2:
             raise ValueError("Both nodes must exist in the network to create a connection.")
 
-        channel = OpticalChannel(distance_km, attenuation_db_per_km)
+        channel = OpticalChannel(distance_km, attenuation_db_per_km, **channel_kwargs)
+        # one fiber serves both directions; either end can act as the sender
         node1.add_link(node2_id, channel)
+        node2.add_link(node1_id, channel)
+        self.topology.add_link(node1_id, node2_id, self._routing_weights(node1, node2, channel),
+                               self._routing_weights(node2, node1, channel))
         print(f"Connected Node {node1_id} and Node {node2_id} with a {distance_km} km link.")
 
-    def establish_end_to_end_raw_key(self, sender_id, receiver_id, path_nodes, num_pulses, pulse_repetition_rate_ns):
+    def disconnect_nodes(self, node1_id, node2_id):
+        if not self.topology.has_link(node1_id, node2_id):
+            raise ValueError(f"Nodes {node1_id} and {node2_id} are not connected.")
+        del self.nodes[node1_id].connected_links[node2_id]
+        del self.nodes[node2_id].connected_links[node1_id]
+        self.topology.remove_link(node1_id, node2_id)
+
+    @staticmethod
+    def _routing_weights(sender_node, receiver_node, channel):
+        """Per-direction link costs: loss in dB, and pulses per expected sifted bit for key-rate routing."""
+        sift_probability = estimate_link(sender_node.qkd_sender.light_source, channel,
+                                         receiver_node.qkd_receiver.detector_dm1)['sift_probability']
+        return {
+            'loss': channel.total_loss_db,
+            'key_rate': 1 / sift_probability if sift_probability > 0 else math.inf,
+        }
+
+    def find_path(self, sender_id, receiver_id, metric='loss'):
+        """Cheapest route between two nodes by total loss or, with metric='key_rate', by pulses per sifted bit."""
+        return self.topology.shortest_path(sender_id, receiver_id, metric)
+
+    def establish_end_to_end_raw_key(self, sender_id, receiver_id, path_nodes, num_pulses, pulse_repetition_rate_ns,
+                                     chunk_size=None, parallel=False, max_workers=None, seed=None, sampling='full',
+                                     routing_metric='loss', cache=None):
+        """Runs every hop of path_nodes and relays an end-to-end raw key over the hop keys."""
+        if path_nodes is None:
+            path_nodes = self.find_path(sender_id, receiver_id, routing_metric)
         if path_nodes[0] != sender_id or path_nodes[-1] != receiver_id:
             raise ValueError("Path must start with sender_id and end with receiver_id.")
 
         print(f"\n--- Establishing end-to-end RAW key from {sender_id} to {receiver_id} via path: {path_nodes} ---")
         
-
-        current_end_to_end_key_segment = [] 
-        
-        for i in range(len(path_nodes) - 1):
-            node1_id = path_nodes[i]
-            node2_id = path_nodes[i+1]
+        run_metrics = StageMetrics(run=f"{sender_id}->{receiver_id}", run_index=len(self.run_metrics))
+        self.run_metrics.append(run_metrics)
+        with run_metrics.time_elapsed():
+            return self._establish_end_to_end_raw_key(sender_id, receiver_id, path_nodes, num_pulses,
+                                                      pulse_repetition_rate_ns, chunk_size, parallel, max_workers,
+                                                      seed, sampling, cache, run_metrics)
+
+    def _establish_end_to_end_raw_key(self, sender_id, receiver_id, path_nodes, num_pulses, pulse_repetition_rate_ns,
+                                      chunk_size, parallel, max_workers, seed, sampling, cache, run_metrics):
+        link_node_ids = list(zip(path_nodes[:-1], path_nodes[1:]))
+        if seed is None:
+            # hop seeds spawned from fresh entropy can never be replayed, so caching them only fills the cache
+            cache = None
+        # one stream per link, plus one for the end-to-end key itself
+        *link_seeds, relay_seed = np.random.SeedSequence(seed).spawn(len(link_node_ids) + 1)
+
+        parallel_link_results = {}
+        if parallel:
+            # cached hops are served below without a worker; only the others go to the pool
+            link_cache_keys = [
+                self.nodes[node1_id].link_cache_key(self.nodes[node2_id], num_pulses, pulse_repetition_rate_ns,
+                                                    chunk_size, link_seeds[i], sampling) if cache is not None else None
+                for i, (node1_id, node2_id) in enumerate(link_node_ids)
+            ]
+            uncached_links = [i for i, cache_key in enumerate(link_cache_keys)
+                              if cache_key is None or cache_key not in cache]
+            parallel_link_results = dict(zip(uncached_links, self._run_links_in_parallel(
+                [link_node_ids[i] for i in uncached_links], [link_seeds[i] for i in uncached_links], num_pulses,
+                pulse_repetition_rate_ns, chunk_size, max_workers, sampling
+            )))
+
+        for i, (node1_id, node2_id) in enumerate(link_node_ids):
             
             node1 = self.nodes[node1_id] 
             node2 = self.nodes[node2_id]
             
-            print(f"Attempting QKD link: {node1_id} <-> {node2_id}")
-            
-            alice_raw_sifted, bob_raw_sifted = node1.generate_and_share_key(
-                node2, num_pulses, pulse_repetition_rate_ns
-            )
-            
-           
-            if i == 0: 
-                current_end_to_end_key_segment = list(alice_raw_sifted) 
-            else: 
+            if i in parallel_link_results:
+                alice_raw_sifted, bob_raw_sifted, session_metrics = parallel_link_results[i]
+                if link_cache_keys[i] is not None:
+                    cache.put(link_cache_keys[i], alice_raw_sifted, bob_raw_sifted, session_metrics.counters)
+                node1.record_key_session(node2, alice_raw_sifted, bob_raw_sifted, num_pulses, session_metrics)
+            else:
+                print(f"Attempting QKD link: {node1_id} <-> {node2_id}")
                 
-                current_end_to_end_key_segment.extend(alice_raw_sifted)
+                alice_raw_sifted, bob_raw_sifted = node1.generate_and_share_key(
+                    node2, num_pulses, pulse_repetition_rate_ns, chunk_size=chunk_size, seed=link_seeds[i],
+                    sampling=sampling, cache=cache
+                )
+            run_metrics.merge(node1.last_session_metrics, include_elapsed=False)
+            
             if not alice_raw_sifted:
                 print(f"Failed to establish raw sifted key for link {node1_id}-{node2_id}. Aborting end-to-end key establishment.")
                 return None
             print(f"Raw sifted key established for link {node1_id} and {node2_id} with length {len(alice_raw_sifted)}")
 
+        end_to_end_key, _ = self.relay_key_along_path(path_nodes, rng=np.random.default_rng(relay_seed))
         print(f"End-to-end RAW sifted key established between {sender_id} and {receiver_id}.")
-        return current_end_to_end_key_segment 
+        return end_to_end_key
+
+    def relay_key_along_path(self, path_nodes, key_length=None, rng=None):
+        """Delivers a fresh random key from path_nodes[0] to path_nodes[-1] by one-time-pad relaying."""
+        rng = rng or np.random.default_rng()
+        sender = self.nodes[path_nodes[0]]
+        receiver = self.nodes[path_nodes[-1]]
+        hop_key_lengths = [len(self.nodes[node1_id].shared_keys.get(node2_id, PackedKey()))
+                           for node1_id, node2_id in zip(path_nodes[:-1], path_nodes[1:])]
+        usable_length = min(hop_key_lengths)
+        if key_length is None:
+            key_length = usable_length
+        elif key_length > usable_length:
+            raise ValueError(f"The shortest link key on the path holds only {usable_length} bits.")
+
+        end_to_end_key = PackedKey.from_bits(rng.integers(0, 2, size=key_length, dtype=np.uint8))
+        ciphertext = end_to_end_key ^ sender.consume_key_with_neighbor(path_nodes[1], key_length)
+        for previous_id, relay_id, next_id in zip(path_nodes[:-2], path_nodes[1:-1], path_nodes[2:]):
+            ciphertext = self.nodes[relay_id].relay_key_classically(previous_id, next_id, ciphertext)
+        received_key = ciphertext ^ receiver.consume_key_with_neighbor(path_nodes[-2], key_length)
+
+        sender.end_to_end_keys[receiver.node_id] = end_to_end_key
+        receiver.end_to_end_keys[sender.node_id] = received_key
+        return end_to_end_key, received_key
+
+    def _run_links_in_parallel(self, link_node_ids, link_seeds, num_pulses, pulse_repetition_rate_ns,
+                               chunk_size, max_workers, sampling):
+        """Runs the given links in a process pool and returns their (alice, bob, metrics) results in order."""
+        if not link_node_ids:
+            return []
+        if max_workers is None:
+            max_workers = min(len(link_node_ids), os.cpu_count() or 1)
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = []
+            for (node1_id, node2_id), link_seed in zip(link_node_ids, link_seeds):
+                print(f"Attempting QKD link: {node1_id} <-> {node2_id}")
+                futures.append(executor.submit(
+                    _run_link_session,
+                    _detached_link_copy(self.nodes[node1_id], node2_id),
+                    _detached_link_copy(self.nodes[node2_id], node1_id),
+                    num_pulses, pulse_repetition_rate_ns, chunk_size, link_seed, sampling
+                ))
+            return [future.result() for future in futures]
+
+    def metrics_snapshot(self):
+        """Structured view of the metrics kept by every node, every link and every run."""
+        return {
+            'nodes': {node_id: node.metrics.as_dict() for node_id, node in self.nodes.items()},
+            'links': {
+                link_metrics.labels['link']: link_metrics.as_dict()
+                for node in self.nodes.values() for link_metrics in node.link_metrics.values()
+            },
+            'runs': [run_metrics.as_dict() for run_metrics in self.run_metrics],
+        }
+
+    def export_metrics_json(self):
+        return metrics_to_json(self.metrics_snapshot())
+
+    def export_metrics_prometheus(self):
+        return metrics_to_prometheus({
+            'node': [node.metrics for node in self.nodes.values()],
+            'link': [link_metrics for node in self.nodes.values() for link_metrics in node.link_metrics.values()],
+            'run': self.run_metrics,
+        })
@@ -0,0 +1,103 @@
+from Keys import PackedKey, as_packed_key
+
+import math
+import time
+
+import numpy as np
+
+DEFAULT_SECURITY_PARAMETER = 1e-10
+
+def binary_entropy(probability):
+    if probability <= 0 or probability >= 1:
+        return 0.0
+    return -probability * math.log2(probability) - (1 - probability) * math.log2(1 - probability)
+
+def secret_key_length(key_length, qber, leaked_bits, security_parameter=DEFAULT_SECURITY_PARAMETER):
+    """Secret bits extractable from a corrected key: n(1 - h2(Q)) - leak_EC - 2 log2(1/eps), at least 0."""
+    if not 0 < security_parameter < 1:
+        raise ValueError("Security parameter must be in (0, 1).")
+    length = key_length * (1 - binary_entropy(qber)) - leaked_bits - 2 * math.log2(1 / security_parameter)
+    return max(int(math.floor(length)), 0)
+
+def toeplitz_hash(key, output_length, seed=None):
+    """Multiplies the key by a random binary Toeplitz matrix of output_length rows, modulo 2.
+
+    The matrix is fixed by its n + m - 1 diagonal bits drawn from seed, which both parties
+    share over the public channel. Row i of the product is entry i + n - 1 of the
+    convolution of those bits with the key, so the product costs one FFT convolution,
+    O((n + m) log(n + m)), rather than O(n * m). Every convolution entry is an integer of
+    at most n, far inside float64's exact range, so rounding recovers it exactly.
+    """
+    key = as_packed_key(key)
+    key_length = len(key)
+    if not 0 <= output_length <= key_length:
+        raise ValueError("Output length must be between 0 and the key length.")
+    if output_length == 0:
+        return PackedKey()
+
+    diagonal_bits = np.random.default_rng(seed).integers(0, 2, size=key_length + output_length - 1, dtype=np.uint8)
+    # entries below n + m - 1 are all that is read, so a circular convolution of that size suffices
+    fft_size = 1 << (key_length + output_length - 2).bit_length()
+    convolution = np.fft.irfft(
+        np.fft.rfft(diagonal_bits, fft_size) * np.fft.rfft(key.to_bits(), fft_size), fft_size
+    )[key_length - 1:key_length - 1 + output_length]
+    return PackedKey.from_bits(np.rint(convolution).astype(np.int64) & 1)
+
+def amplify_privacy(key, qber, leaked_bits, security_parameter=DEFAULT_SECURITY_PARAMETER, seed=None,
+                    block_size=None):
+    """Compresses a corrected key to its secret length with Toeplitz hashing.
+
+    By default the whole key is hashed with a single matrix. With a block_size, the key
+    is split into blocks hashed independently with their own matrices, which bounds the
+    FFT size. This assumes the error correction leakage is spread over the key in
+    proportion to block length, which is only true on average; each block also pays
+    the finite-size term with security_parameter / number of blocks, so the blocks
+    together keep the requested security parameter, at the cost of a shorter key.
+    Returns the secret key, its length and the hashing throughput.
+    """
+    start_time = time.perf_counter()
+    key = as_packed_key(key)
+    if block_size is None or block_size >= len(key):
+        secret_length = secret_key_length(len(key), qber, leaked_bits, security_parameter)
+        secret_key = toeplitz_hash(key, secret_length, seed)
+    elif block_size <= 0:
+        raise ValueError("Block size must be positive.")
+    else:
+        block_starts = range(0, len(key), block_size)
+        block_seeds = np.random.SeedSequence(seed).spawn(len(block_starts))
+        secret_key = PackedKey()
+        for block_start, block_seed in zip(block_starts, block_seeds):
+            block = key[block_start:block_start + block_size]
+            block_length = secret_key_length(len(block), qber, leaked_bits * len(block) / len(key),
+                                             security_parameter / len(block_starts))
+            secret_key.extend(toeplitz_hash(block, block_length, block_seed))
+        secret_length = len(secret_key)
+
+    elapsed_s = time.perf_counter() - start_time
+    return {
+        'secret_key': secret_key,
+        'secret_length': secret_length,
+        'elapsed_s': elapsed_s,
+        'throughput_mbps': len(key) / elapsed_s / 1e6 if elapsed_s > 0 else float('inf'),
+    }
+
+def amplify_link_keys(alice_node, bob_node, qber, security_parameter=DEFAULT_SECURITY_PARAMETER, seed=None):
+    """Turns the corrected keys two nodes share into secret keys stored in Node.secret_keys.
+
+    qber is the error rate estimated before error correction; the leakage comes from
+    the bits error correction recorded in alice_node.leaked_bits.
+    """
+    alice_key = alice_node.shared_keys.get(bob_node.node_id)
+    bob_key = bob_node.shared_keys.get(alice_node.node_id)
+    if alice_key is None or bob_key is None:
+        raise ValueError(f"Nodes {alice_node.node_id} and {bob_node.node_id} do not share a sifted key.")
+
+    leaked_bits = alice_node.leaked_bits.get(bob_node.node_id, 0)
+    alice_result = amplify_privacy(alice_key, qber, leaked_bits, security_parameter, seed)
+    bob_result = amplify_privacy(bob_key, qber, leaked_bits, security_parameter, seed)
+    alice_node.secret_keys[bob_node.node_id] = alice_result['secret_key']
+    bob_node.secret_keys[alice_node.node_id] = bob_result['secret_key']
+
+    print(f"Privacy amplification between {alice_node.node_id} and {bob_node.node_id}: "
+          f"{len(alice_key)} -> {alice_result['secret_length']} bits, {alice_result['throughput_mbps']:.1f} Mbit/s")
+    return alice_result
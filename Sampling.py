@@ -0,0 +1,143 @@
+from Keys import PackedKey
+
+import functools
+import math
+
+import numpy as np
+
+DEFAULT_WINDOW_SIZE = 10**8
+
+def bernoulli_positions(rng, probability, start, stop):
+    """Positions in [start, stop) of independent Bernoulli(probability) successes, drawn as geometric gaps."""
+    if probability <= 0 or stop <= start:
+        return np.zeros(0, dtype=np.int64)
+    if probability >= 1:
+        return np.arange(start, stop, dtype=np.int64)
+
+    position_batches = []
+    last_position = start - 1
+    while True:
+        batch_size = int((stop - last_position) * probability * 1.1) + 16
+        positions = last_position + np.cumsum(rng.geometric(probability, size=batch_size), dtype=np.int64)
+        position_batches.append(positions[positions < stop])
+        if positions[-1] >= stop:
+            break
+        last_position = positions[-1]
+    return np.concatenate(position_batches)
+
+@functools.lru_cache(maxsize=64)
+def _poisson_cdf(mean):
+    """CDF of Poisson(mean) up to the count where its remaining tail is negligible."""
+    probabilities = [math.exp(-mean)]
+    total = probabilities[0]
+    while 1 - total > 1e-15 and len(probabilities) < 1000:
+        probabilities.append(probabilities[-1] * mean / len(probabilities))
+        total += probabilities[-1]
+    cdf = np.cumsum(probabilities)
+    cdf.flags.writeable = False
+    return cdf
+
+def zero_truncated_poisson(rng, mean, size):
+    """Poisson(mean) samples conditioned on being at least one, by inverting the CDF."""
+    cdf = _poisson_cdf(mean)
+    draws = rng.uniform(cdf[0], cdf[-1], size=size)
+    return np.searchsorted(cdf, draws)
+
+def sample_sifted_keys_event_skipping(light_source, channel, receiver, num_pulses, rng, window_size=None,
+                                      metrics=None, sifted_keys=None):
+    """Samples the sifted keys of a link by visiting only the slots that can click.
+
+    A slot can click only if its pulse and the previous one both kept a photon, or a
+    detector fires a dark count. The positions of photon-carrying pulses and of dark
+    counts are drawn as geometric gaps, and only the union of those candidate slots is
+    simulated in full. Every other slot is silent with certainty, so the keys have the
+    same distribution as the per-slot simulation. Slots are processed in windows of
+    window_size, so memory follows the number of events rather than num_pulses.
+    Photon, click and dark-count counters are added to metrics when given. Skipping
+    slots is only exact for memoryless detectors, so dead time and afterpulsing are
+    rejected. sifted_keys, a pair of sinks with an extend method (PackedKeys or
+    Storage.KeyWriters), receives each window's sifted bits as they are sampled.
+    """
+    if receiver.detector_dm1.has_memory or receiver.detector_dm2.has_memory:
+        raise ValueError("Event-skipping sampling does not model detector dead time or afterpulsing; "
+                         "use sampling='full' instead.")
+    window_size = window_size or DEFAULT_WINDOW_SIZE
+    received_mu = light_source.mu * channel.survival_probability
+    photon_probability = -math.expm1(-received_mu)
+
+    alice_sifted_key, bob_sifted_key = sifted_keys if sifted_keys is not None else (PackedKey(), PackedKey())
+    previous_window_last_count = 0
+
+    for start in range(0, num_pulses, window_size):
+        stop = min(start + window_size, num_pulses)
+
+        photon_positions = bernoulli_positions(rng, photon_probability, start, stop)
+        photon_counts = zero_truncated_poisson(rng, received_mu, len(photon_positions))
+        if metrics is not None:
+            metrics.increment('photons_surviving', np.sum(photon_counts))
+
+        # photons reach a detector only when the previous pulse also kept some
+        previous_counts = np.zeros_like(photon_counts)
+        if len(photon_positions):
+            follows_photon_pulse = np.diff(photon_positions) == 1
+            previous_counts[1:][follows_photon_pulse] = photon_counts[:-1][follows_photon_pulse]
+            if photon_positions[0] == start:
+                previous_counts[0] = previous_window_last_count
+        interfering = previous_counts > 0
+        photon_slots = photon_positions[interfering]
+        incident_photons = np.minimum(photon_counts, previous_counts)[interfering]
+
+        previous_window_last_count = (photon_counts[-1] if len(photon_positions) and photon_positions[-1] == stop - 1
+                                      else 0)
+
+        dark_slots_dm1 = bernoulli_positions(rng, receiver.detector_dm1.prob_dark_count_per_window, start, stop)
+        dark_slots_dm2 = bernoulli_positions(rng, receiver.detector_dm2.prob_dark_count_per_window, start, stop)
+
+        # the first slot has no preceding pulse and is never sifted
+        after_first_slot = photon_slots >= 1
+        photon_slots = photon_slots[after_first_slot]
+        incident_photons = incident_photons[after_first_slot]
+        dark_slots_dm1 = dark_slots_dm1[dark_slots_dm1 >= 1]
+        dark_slots_dm2 = dark_slots_dm2[dark_slots_dm2 >= 1]
+
+        # one sort merges the three slot lists and maps each of them into the merged one
+        candidate_slots, candidate_index = np.unique(np.concatenate((photon_slots, dark_slots_dm1, dark_slots_dm2)),
+                                                     return_inverse=True)
+        if not len(candidate_slots):
+            continue
+        photon_index, dm1_index, dm2_index = np.split(
+            candidate_index, [len(photon_slots), len(photon_slots) + len(dark_slots_dm1)]
+        )
+
+        candidate_photons = np.zeros(len(candidate_slots), dtype=np.int64)
+        candidate_photons[photon_index] = incident_photons
+        dark_dm1 = np.zeros(len(candidate_slots), dtype=bool)
+        dark_dm1[dm1_index] = True
+        dark_dm2 = np.zeros(len(candidate_slots), dtype=bool)
+        dark_dm2[dm2_index] = True
+
+        # phase differences of independent uniform phases are independent uniform bits
+        alice_bits = rng.integers(0, 2, size=len(candidate_slots), dtype=np.int8)
+        efficiency = np.where(alice_bits == 0, receiver.detector_dm1.quantum_efficiency,
+                              receiver.detector_dm2.quantum_efficiency)
+        photon_click = rng.random(len(candidate_slots)) < 1 - (1 - efficiency)**candidate_photons
+
+        click_dm1 = (photon_click & (alice_bits == 0)) | dark_dm1
+        click_dm2 = (photon_click & (alice_bits == 1)) | dark_dm2
+
+        # a double click resolves towards the interference maximum, i.e. Alice's bit
+        bob_bits = np.where(click_dm1 & click_dm2, alice_bits, np.where(click_dm1, 0, 1)).astype(np.int8)
+        sifted = click_dm1 | click_dm2
+
+        if metrics is not None:
+            metrics.increment('clicks_dm1', np.count_nonzero(click_dm1))
+            metrics.increment('clicks_dm2', np.count_nonzero(click_dm2))
+            metrics.increment('double_clicks', np.count_nonzero(click_dm1 & click_dm2))
+            metrics.increment('dark_count_clicks',
+                              np.count_nonzero(dark_dm1 & ~(photon_click & (alice_bits == 0)))
+                              + np.count_nonzero(dark_dm2 & ~(photon_click & (alice_bits == 1))))
+
+        alice_sifted_key.extend(alice_bits[sifted])
+        bob_sifted_key.extend(bob_bits[sifted])
+
+    return alice_sifted_key, bob_sifted_key
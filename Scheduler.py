@@ -0,0 +1,266 @@
+from Metrics import StageMetrics
+from Sampling import sample_sifted_keys_event_skipping
+
+import contextlib
+import heapq
+import io
+import time
+from collections import deque
+
+import numpy as np
+
+GENERATION_DONE = 'generation_done'
+REQUEST_ARRIVAL = 'request_arrival'
+
+class EventScheduler:
+    """Heap-based discrete-event simulation of key supply and demand on a Network.
+
+    Every registered link runs back-to-back generation batches of pulses_per_batch
+    pulses. With event-skipping sampling a batch is drawn directly from the link's
+    own random stream and the nodes' existing Sender and Receiver; with full sampling
+    it runs through Node.generate_and_share_key. The sifted bits of a batch become
+    available when it ends in simulated time, and they are appended to the link's key
+    buffer: the nodes' shared_keys entries for each other. End-to-end key requests
+    wait in arrival order. A request is served once every hop on its route holds
+    enough bits; it is then delivered by one-time-pad relaying along the route
+    (Network.relay_key_along_path), which uses up that many bits of every hop
+    buffer. Each link keeps a FIFO queue of the requests routed over it, and only a
+    request at the head of all its hop queues is served, so later requests cannot
+    overtake earlier ones on a shared link. A deposit or a served request only
+    re-checks the heads of the queues it touched.
+    """
+
+    def __init__(self, network, pulses_per_batch=10**5, pulse_repetition_rate_ns=1, sampling='event_skipping',
+                 seed=None, routing_metric='loss', verbose=False):
+        self.network = network
+        self.pulses_per_batch = pulses_per_batch
+        self.pulse_repetition_rate_ns = pulse_repetition_rate_ns
+        self.sampling = sampling
+        self.routing_metric = routing_metric
+        self.verbose = verbose
+        self._seed_sequence = np.random.SeedSequence(seed)
+        self._relay_rng = np.random.default_rng(self._seed_sequence.spawn(1)[0])
+
+        self.now_ns = 0.0
+        self._events = []
+        self._event_count = 0
+        self.events_processed = 0
+        self.wall_seconds = 0.0
+
+        self.links = {}
+        self.num_requests = 0
+        self.num_waiting = 0
+        self.completed_requests = []
+
+    @staticmethod
+    def _link_id(node1_id, node2_id):
+        return frozenset((node1_id, node2_id))
+
+    def _schedule(self, time_ns, kind, payload):
+        # the counter keeps events at equal times in scheduling order
+        heapq.heappush(self._events, (time_ns, self._event_count, kind, payload))
+        self._event_count += 1
+
+    def add_link(self, node1_id, node2_id, start_ns=0.0):
+        """Starts continuous key generation on an existing link, with node1_id as the sender."""
+        if not self.network.topology.has_link(node1_id, node2_id):
+            raise ValueError(f"Nodes {node1_id} and {node2_id} are not connected.")
+        link_id = self._link_id(node1_id, node2_id)
+        if link_id in self.links:
+            raise ValueError(f"Link {node1_id}-{node2_id} is already generating keys.")
+
+        seed_sequence = self._seed_sequence.spawn(1)[0]
+        self.links[link_id] = {
+            'sender': node1_id,
+            'receiver': node2_id,
+            'seed_sequence': seed_sequence,
+            'rng': np.random.default_rng(seed_sequence),
+            'bits_generated': 0,
+            'bits_consumed': 0,
+            'buffer_bits': self._buffer_length(node1_id, node2_id),
+            'max_buffer_bits': 0,
+            'buffer_bit_ns': 0.0,
+            'last_change_ns': start_ns,
+            'start_ns': start_ns,
+            'queue': deque(),
+        }
+        self._schedule(start_ns + self.pulses_per_batch * self.pulse_repetition_rate_ns, GENERATION_DONE, link_id)
+
+    def add_all_links(self):
+        for node_id in self.network.topology.adjacency:
+            for neighbor_id in self.network.topology.neighbors(node_id):
+                if self._link_id(node_id, neighbor_id) not in self.links:
+                    self.add_link(node_id, neighbor_id)
+
+    def request_key(self, sender_id, receiver_id, num_bits, at_ns=None, path_nodes=None):
+        """Schedules an end-to-end key request; without path_nodes it is routed on arrival."""
+        if num_bits <= 0:
+            raise ValueError("A key request must ask for a positive number of bits.")
+        at_ns = self.now_ns if at_ns is None else at_ns
+        if at_ns < self.now_ns:
+            raise ValueError("Requests cannot be scheduled in the simulated past.")
+        request = {
+            'request_index': self.num_requests,
+            'sender': sender_id,
+            'receiver': receiver_id,
+            'num_bits': num_bits,
+            'path': path_nodes,
+            'arrival_ns': at_ns,
+            'served_ns': None,
+        }
+        self.num_requests += 1
+        self._schedule(at_ns, REQUEST_ARRIVAL, request)
+        return request
+
+    def _buffer_length(self, node1_id, node2_id):
+        key = self.network.nodes[node1_id].shared_keys.get(node2_id)
+        return len(key) if key is not None else 0
+
+    def _set_buffer_bits(self, link, buffer_bits):
+        """Updates a buffer's occupancy, integrating the old level over the time it was held."""
+        link['buffer_bit_ns'] += link['buffer_bits'] * (self.now_ns - link['last_change_ns'])
+        link['last_change_ns'] = self.now_ns
+        link['buffer_bits'] = buffer_bits
+        link['max_buffer_bits'] = max(link['max_buffer_bits'], buffer_bits)
+
+    def _finish_generation(self, link_id):
+        link = self.links[link_id]
+        sender = self.network.nodes[link['sender']]
+        receiver = self.network.nodes[link['receiver']]
+        alice_buffer = sender.shared_keys.get(receiver.node_id)
+        bob_buffer = receiver.shared_keys.get(sender.node_id)
+
+        if self.sampling == 'event_skipping':
+            alice_batch, bob_batch = self._sample_batch(link, sender, receiver)
+        else:
+            with contextlib.nullcontext() if self.verbose else contextlib.redirect_stdout(io.StringIO()):
+                alice_batch, bob_batch = sender.generate_and_share_key(
+                    receiver, self.pulses_per_batch, self.pulse_repetition_rate_ns,
+                    seed=link['seed_sequence'].spawn(1)[0], sampling=self.sampling
+                )
+        # generate_and_share_key stores only the new batch; append it to the buffered bits instead
+        if alice_buffer is not None and bob_buffer is not None:
+            alice_buffer.extend(alice_batch)
+            bob_buffer.extend(bob_batch)
+            sender.shared_keys[receiver.node_id] = alice_buffer
+            receiver.shared_keys[sender.node_id] = bob_buffer
+
+        link['bits_generated'] += len(alice_batch)
+        self._set_buffer_bits(link, len(sender.shared_keys[receiver.node_id]))
+        self._schedule(self.now_ns + self.pulses_per_batch * self.pulse_repetition_rate_ns, GENERATION_DONE, link_id)
+        if link['queue']:
+            self._serve_waiting_requests([link['queue'][0]])
+
+    def _sample_batch(self, link, sender, receiver):
+        """Samples one event-skipping batch and records it like a generate_and_share_key session.
+
+        Batches happen thousands of times per simulated second, so they reuse the link's
+        components instead of rebuilding them and skip the per-session log lines.
+        """
+        batch_metrics = StageMetrics(link=f"{sender.node_id}->{receiver.node_id}")
+        with batch_metrics.time_elapsed(), batch_metrics.time_stage('sampling'):
+            alice_batch, bob_batch = sample_sifted_keys_event_skipping(
+                sender.qkd_sender.light_source, sender.connected_links[receiver.node_id], receiver.qkd_receiver,
+                self.pulses_per_batch, link['rng'], metrics=batch_metrics
+            )
+        batch_metrics.increment('sessions')
+        batch_metrics.increment('pulses', self.pulses_per_batch)
+        batch_metrics.increment('sifted_bits', len(alice_batch))
+        return sender.record_key_session(receiver, alice_batch, bob_batch, self.pulses_per_batch, batch_metrics)
+
+    def _route(self, request):
+        if request['path'] is None:
+            request['path'] = self.network.find_path(request['sender'], request['receiver'], self.routing_metric)
+        hops = []
+        for node1_id, node2_id in zip(request['path'][:-1], request['path'][1:]):
+            hop = self._link_id(node1_id, node2_id)
+            if hop not in self.links:
+                raise ValueError(f"Link {node1_id}-{node2_id} on the route is not generating keys.")
+            hops.append(hop)
+        return hops
+
+    def _enqueue(self, request):
+        request['hops'] = self._route(request)
+        for hop in request['hops']:
+            self.links[hop]['queue'].append(request)
+        self.num_waiting += 1
+        self._serve_waiting_requests([request])
+
+    def _serve_waiting_requests(self, candidates):
+        """Serves candidate requests that head all their hop queues and fit in every hop buffer.
+
+        Serving a request promotes the next request in each of its queues to a candidate.
+        """
+        while candidates:
+            request = candidates.pop()
+            hops = request['hops']
+            if request['served_ns'] is None and all(
+                self.links[hop]['queue'][0] is request and self.links[hop]['buffer_bits'] >= request['num_bits']
+                for hop in hops
+            ):
+                self._consume(request, hops)
+                for hop in hops:
+                    queue = self.links[hop]['queue']
+                    queue.popleft()
+                    if queue:
+                        candidates.append(queue[0])
+
+    def _consume(self, request, hops):
+        self.network.relay_key_along_path(request['path'], request['num_bits'], self._relay_rng)
+        for hop in hops:
+            link = self.links[hop]
+            link['bits_consumed'] += request['num_bits']
+            self._set_buffer_bits(link, link['buffer_bits'] - request['num_bits'])
+        request['served_ns'] = self.now_ns
+        request['latency_ns'] = self.now_ns - request['arrival_ns']
+        self.num_waiting -= 1
+        self.completed_requests.append(request)
+
+    def run(self, until_ns):
+        """Processes events in time order up to and including until_ns."""
+        start_time = time.perf_counter()
+        while self._events and self._events[0][0] <= until_ns:
+            self.now_ns, _, kind, payload = heapq.heappop(self._events)
+            if kind == GENERATION_DONE:
+                self._finish_generation(payload)
+            else:
+                self._enqueue(payload)
+            self.events_processed += 1
+        self.now_ns = max(self.now_ns, until_ns)
+        self.wall_seconds += time.perf_counter() - start_time
+        return self.report()
+
+    def report(self):
+        """Per-request latencies, latency summary and per-link buffer occupancy at the current time."""
+        latencies = np.array([request['latency_ns'] for request in self.completed_requests], dtype=float)
+        latency_summary = {}
+        if len(latencies):
+            latency_summary = {
+                'mean_ns': float(latencies.mean()),
+                'p50_ns': float(np.percentile(latencies, 50)),
+                'p95_ns': float(np.percentile(latencies, 95)),
+                'max_ns': float(latencies.max()),
+            }
+
+        links = {}
+        for link in self.links.values():
+            held_ns = self.now_ns - link['start_ns']
+            buffer_bit_ns = link['buffer_bit_ns'] + link['buffer_bits'] * (self.now_ns - link['last_change_ns'])
+            links[f"{link['sender']}->{link['receiver']}"] = {
+                'buffer_bits': link['buffer_bits'],
+                'mean_buffer_bits': buffer_bit_ns / held_ns if held_ns > 0 else float(link['buffer_bits']),
+                'max_buffer_bits': link['max_buffer_bits'],
+                'bits_generated': link['bits_generated'],
+                'bits_consumed': link['bits_consumed'],
+            }
+
+        return {
+            'now_ns': self.now_ns,
+            'requests': [{name: value for name, value in request.items() if name != 'hops'} for request in self.completed_requests],
+            'requests_served': len(self.completed_requests),
+            'requests_waiting': self.num_waiting,
+            'latency': latency_summary,
+            'links': links,
+            'events_processed': self.events_processed,
+            'events_per_s': self.events_processed / self.wall_seconds if self.wall_seconds > 0 else 0.0,
+        }
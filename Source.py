@@ -1,12 +1,18 @@
 import random
 import math
 
+import numpy as np
+
+from Tracing import (TraceBuffer, TRACE_OFF, TRACE_COUNTERS, TRACE_SAMPLED, TRACE_FULL,
+                     DEFAULT_TRACE_CAPACITY, DEFAULT_TRACE_SAMPLE_EVERY, validate_trace_settings, record_to_dict)
+
 class LightSource:
     
-    def __init__(self, average_photon_number=0.2):
+    def __init__(self, average_photon_number=0.2, rng=None):
         if not (0 < average_photon_number < 1):
             raise ValueError("Average photon number (mu) for WCP should be between 0 and 1.")
         self.mu = average_photon_number 
+        self.rng = rng if rng is not None else np.random.default_rng()
 
     def generate_single_pulse_photon_count(self):
         num_photons = 0
@@ -19,6 +25,10 @@ class LightSource:
         num_photons = k - 1
         return num_photons
 
+    def generate_photon_counts(self, num_pulses):
+        """Draws the Poisson photon numbers of a batch of pulses in one vectorized call."""
+        return self.rng.poisson(self.mu, size=num_pulses)
+
     def get_initial_phase(self):
        
         return 0.0 
@@ -28,37 +38,104 @@ class PhaseModulator:
     def modulate_phase(self, current_phase, desired_phase_shift):
         return (current_phase + desired_phase_shift) % (2 * math.pi)
 
+SENT_PULSE_DTYPE = np.dtype([
+    ('time_slot', np.float64),
+    ('photon_count', np.int64),
+    ('modulated_phase', np.float64),
+    ('alice_intended_bit_for_pair', np.int8),
+])
+
 class Sender:
    
-    def __init__(self, avg_photon_number=0.2):
-        self.light_source = LightSource(avg_photon_number)
+    def __init__(self, avg_photon_number=0.2, rng=None, trace_level=TRACE_COUNTERS,
+                 trace_capacity=DEFAULT_TRACE_CAPACITY, trace_sample_every=DEFAULT_TRACE_SAMPLE_EVERY):
+        validate_trace_settings(trace_level, trace_capacity, trace_sample_every)
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.light_source = LightSource(avg_photon_number, rng=self.rng)
         self.phase_modulator = PhaseModulator()
-        self.raw_key_bits = [] 
-        self.sent_pulses_info = [] 
+        self.trace_level = trace_level
+        self.trace_sample_every = trace_sample_every
+        self.counters = {'pulses_sent': 0, 'photons_sent': 0}
+        self.trace = (TraceBuffer(SENT_PULSE_DTYPE, trace_capacity)
+                      if trace_level in (TRACE_SAMPLED, TRACE_FULL) else None)
+        # a Storage.TraceWriter set here receives every traced pulse, including those the ring evicts
+        self.trace_writer = None
+
+    @property
+    def sent_pulses_info(self):
+        """The traced pulses as a list of dicts, oldest first."""
+        if self.trace is None:
+            return []
+        return [record_to_dict(record) for record in self.trace.to_array()]
+
+    @property
+    def raw_key_bits(self):
+        if self.trace is None:
+            return []
+        return self.trace.to_array()['alice_intended_bit_for_pair'].tolist()
+
+    def reset_trace(self):
+        self.counters = dict.fromkeys(self.counters, 0)
+        if self.trace is not None:
+            self.trace.clear()
+
+    def _record_pulses(self, columns, num_pulses):
+        """Updates the counters and the trace for num_pulses pulses given as column arrays."""
+        if self.trace_level == TRACE_OFF:
+            return
+        first_pulse_number = self.counters['pulses_sent']
+        self.counters['pulses_sent'] += num_pulses
+        self.counters['photons_sent'] += int(np.sum(columns['photon_count']))
+
+        if self.trace_level == TRACE_SAMPLED:
+            sampled = np.flatnonzero((first_pulse_number + np.arange(num_pulses)) % self.trace_sample_every == 0)
+            columns = {name: np.asarray(values)[sampled] for name, values in columns.items()}
+        if self.trace is not None:
+            self.trace.append_columns(columns)
+        if self.trace_writer is not None:
+            self.trace_writer.append(columns)
 
     def prepare_and_send_pulse(self, time_slot, previous_pulse_phase=0):
 
         current_secret_bit = random.randint(0, 1) 
-        self.raw_key_bits.append(current_secret_bit)
         desired_phase_difference_for_bit = 0.0 if current_secret_bit == 0 else math.pi
         
         modulated_phase_on_this_pulse = random.choice([0.0, math.pi])
         
         photon_count = self.light_source.generate_single_pulse_photon_count()
         
-        self.sent_pulses_info.append({
-            'time_slot': time_slot,
-            'photon_count': photon_count,
-            'modulated_phase': modulated_phase_on_this_pulse,
-            'alice_intended_bit_for_pair': current_secret_bit 
-        })
+        self._record_pulses({
+            'time_slot': [time_slot],
+            'photon_count': [photon_count],
+            'modulated_phase': [modulated_phase_on_this_pulse],
+            'alice_intended_bit_for_pair': [current_secret_bit]
+        }, 1)
         
         return modulated_phase_on_this_pulse, photon_count
 
+    def prepare_pulses(self, num_pulses, pulse_repetition_rate_ns=1, start_index=0):
+        """Prepares a batch of pulses and returns them as column arrays.
+
+        The columns use the same keys as the entries of sent_pulses_info, with one
+        element per pulse, and are counted and traced like single pulses.
+        """
+        intended_bits = self.rng.integers(0, 2, size=num_pulses, dtype=np.int8)
+        modulated_phases = self.rng.integers(0, 2, size=num_pulses) * math.pi
+        photon_counts = self.light_source.generate_photon_counts(num_pulses)
+        time_slots = (start_index + np.arange(num_pulses, dtype=np.int64)) * pulse_repetition_rate_ns
+
+        pulses = {
+            'time_slot': time_slots,
+            'photon_count': photon_counts,
+            'modulated_phase': modulated_phases,
+            'alice_intended_bit_for_pair': intended_bits
+        }
+        self._record_pulses(pulses, num_pulses)
+        return pulses
+
     def get_pulse_info(self, time_slot):
-        """Retrieves information about a pulse Alice sent at a given time slot."""
-        for pulse_info in self.sent_pulses_info:
-            if pulse_info['time_slot'] == time_slot:
-                return pulse_info
-        return None
-    
+        """Retrieves information about a traced pulse Alice sent at a given time slot."""
+        if self.trace is None:
+            return None
+        record = self.trace.lookup('time_slot', time_slot)
+        return None if record is None else record_to_dict(record)
@@ -0,0 +1,216 @@
+from Keys import PackedKey, as_packed_key
+
+import json
+import os
+
+import numpy as np
+
+KEY_SUFFIX = '.bits'
+# appended keys reach the file in slices of this many bytes, bounding the copies made on the way
+WRITE_SLICE_BYTES = 2**20
+TRACE_SCHEMA_FILE = 'columns.json'
+
+def _write_json(path, content):
+    # written beside the target and renamed, so readers never see a half-written file
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w') as metadata_file:
+        json.dump(content, metadata_file, indent=2)
+    os.replace(temporary_path, path)
+
+class KeyWriter:
+    """Appends bits to a key file as they arrive; only the last partial byte is held in memory.
+
+    The bits go to a temporary file that replaces the key on close, followed by the
+    metadata with the final length, so a key is only visible in the store once it is
+    complete and an older key of the same name that is still mapped stays intact.
+    extend is an alias of append, so a writer can collect sifted bits in place of a PackedKey.
+    """
+
+    def __init__(self, store, name, metadata=None):
+        self.store = store
+        self.name = name
+        self.metadata = dict(metadata or {})
+        self.length = 0
+        self._pending = PackedKey()
+        self._file = open(store.key_path(name) + '.tmp', 'wb')
+
+    def __len__(self):
+        return self.length + len(self._pending)
+
+    def append(self, bits):
+        key = as_packed_key(bits)
+        if len(self._pending):
+            # bits after an unaligned end must be shifted, one bounded slice at a time
+            for slice_start in range(0, len(key), 8 * WRITE_SLICE_BYTES):
+                self._pending.extend(key[slice_start:slice_start + 8 * WRITE_SLICE_BYTES])
+                whole_bytes = len(self._pending) // 8
+                self._write_bytes(self._pending.packed[:whole_bytes])
+                self._pending = self._pending[8 * whole_bytes:]
+            return
+
+        # on a byte boundary the packed bytes go to the file as they are, without a copy
+        whole_bytes = len(key) // 8
+        packed = memoryview(key.packed)
+        for slice_start in range(0, whole_bytes, WRITE_SLICE_BYTES):
+            self._write_bytes(packed[slice_start:min(slice_start + WRITE_SLICE_BYTES, whole_bytes)])
+        self._pending = key[8 * whole_bytes:]
+
+    extend = append
+
+    def _write_bytes(self, data):
+        self._file.write(data)
+        self.length += 8 * len(data)
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.write(self._pending.tobytes())
+        self.length += len(self._pending)
+        self._pending = PackedKey()
+        self._file.close()
+        os.replace(self._file.name, self.store.key_path(self.name))
+        _write_json(self.store.metadata_path(self.name), dict(self.metadata, length=self.length))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class KeyStore:
+    """Directory of packed-bit key files, each with a JSON metadata file holding its length.
+
+    Keys are opened as PackedKeys over read-only memory maps, so a key larger than
+    RAM can be sliced and analysed, and several processes can share the same pages.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def key_path(self, name):
+        if not name or os.sep in name or name.startswith('.'):
+            raise ValueError(f"Invalid key name '{name}'.")
+        return os.path.join(self.directory, name + KEY_SUFFIX)
+
+    def metadata_path(self, name):
+        return self.key_path(name)[:-len(KEY_SUFFIX)] + '.json'
+
+    def names(self):
+        return sorted(file_name[:-len('.json')] for file_name in os.listdir(self.directory)
+                      if file_name.endswith('.json') and os.path.exists(self.key_path(file_name[:-len('.json')])))
+
+    def __contains__(self, name):
+        return os.path.exists(self.metadata_path(name))
+
+    def metadata(self, name):
+        if name not in self:
+            raise ValueError(f"No key named '{name}' in {self.directory}.")
+        with open(self.metadata_path(name)) as metadata_file:
+            return json.load(metadata_file)
+
+    def writer(self, name, metadata=None):
+        return KeyWriter(self, name, metadata)
+
+    def write(self, name, key, metadata=None):
+        with self.writer(name, metadata) as key_writer:
+            key_writer.append(key)
+
+    def open(self, name, start=0, stop=None):
+        """The stored bits [start, stop) as a PackedKey backed by a read-only memory map.
+
+        A range starting on a byte boundary and ending on one or at the end of the key
+        is a zero-copy view of the file; any other range is copied out of the map.
+        """
+        length = self.metadata(name)['length']
+        start, stop, _ = slice(start, stop).indices(length)
+        stop = max(stop, start)
+        if stop == start:
+            return PackedKey()
+
+        if start % 8 == 0 and (stop % 8 == 0 or stop == length):
+            data = np.memmap(self.key_path(name), dtype=np.uint8, mode='r', offset=start // 8,
+                             shape=((stop - start + 7) // 8,))
+            return PackedKey.from_packed(data, stop - start)
+        data = np.memmap(self.key_path(name), dtype=np.uint8, mode='r', shape=((length + 7) // 8,))
+        return PackedKey.from_packed(data, length)[start:stop]
+
+    def delete(self, name):
+        os.remove(self.metadata_path(name))
+        os.remove(self.key_path(name))
+
+def save_shared_keys(node, store):
+    """Writes every key the node shares with a neighbor under the name '<node>--<neighbor>'."""
+    for neighbor_id, key in node.shared_keys.items():
+        store.write(f"{node.node_id}--{neighbor_id}", key, {'node': node.node_id, 'neighbor': neighbor_id})
+
+def load_shared_keys(node, store):
+    """Replaces the node's shared keys with memory-mapped ones from the store."""
+    for name in store.names():
+        metadata = store.metadata(name)
+        if metadata.get('node') == node.node_id:
+            node.shared_keys[metadata['neighbor']] = store.open(name)
+
+class TraceWriter:
+    """Appends structured trace records column by column, one raw binary file per field.
+
+    A schema file with the dtype and record count is rewritten after every append, so
+    the columns can be memory-mapped by other processes while a run is still writing.
+    """
+
+    def __init__(self, directory, dtype):
+        self.directory = directory
+        self.dtype = np.dtype(dtype)
+        self.length = 0
+        os.makedirs(directory, exist_ok=True)
+        self._files = {name: open(os.path.join(directory, name + '.bin'), 'wb') for name in self.dtype.names}
+        self._write_schema()
+
+    def _write_schema(self):
+        _write_json(os.path.join(self.directory, TRACE_SCHEMA_FILE), {
+            'length': self.length,
+            'columns': {name: self.dtype[name].str for name in self.dtype.names},
+        })
+
+    def append(self, records):
+        """Appends a structured array or a {field: array} mapping of equal-length columns."""
+        num_records = len(records[self.dtype.names[0]])
+        for name, column_file in self._files.items():
+            column_file.write(np.ascontiguousarray(records[name], dtype=self.dtype[name]).tobytes())
+            column_file.flush()
+        self.length += num_records
+        self._write_schema()
+
+    def close(self):
+        for column_file in self._files.values():
+            column_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def save_trace(directory, records):
+    """Writes a trace (a TraceBuffer or a structured array) as memory-mappable columns."""
+    records = records.to_array() if hasattr(records, 'to_array') else records
+    with TraceWriter(directory, records.dtype) as trace_writer:
+        trace_writer.append(records)
+
+def open_trace(directory):
+    """The columns of a stored trace as a {field: read-only memory-mapped array} dict."""
+    with open(os.path.join(directory, TRACE_SCHEMA_FILE)) as schema_file:
+        schema = json.load(schema_file)
+    columns = {}
+    for name, dtype in schema['columns'].items():
+        if schema['length']:
+            columns[name] = np.memmap(os.path.join(directory, name + '.bin'), dtype=dtype, mode='r',
+                                      shape=(schema['length'],))
+        else:
+            columns[name] = np.zeros(0, dtype=dtype)
+    return columns
+
+def export_trace_npz(directory, path, compress=True):
+    """Copies a stored trace into a single columnar .npz archive, one array per field."""
+    columns = open_trace(directory)
+    (np.savez_compressed if compress else np.savez)(path, **columns)
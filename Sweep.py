@@ -0,0 +1,205 @@
+from main import run_point_to_point_simulation
+from Analytics import estimate_point_to_point
+from Cache import LinkResultCache
+
+import argparse
+import contextlib
+import csv
+import hashlib
+import inspect
+import io
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+DEFAULT_PARAMETERS = {
+    name: parameter.default
+    for name, parameter in inspect.signature(run_point_to_point_simulation).parameters.items()
+    if name not in ('seed', 'cache')
+}
+SWEEPABLE_PARAMETERS = list(DEFAULT_PARAMETERS)
+
+RESULT_FIELDS = ['point_id', 'seed', 'sifted_key_length', 'qber', 'sifted_rate_per_pulse', 'elapsed_s']
+
+def expand_parameter_grid(parameter_grid, base_params=None):
+    """Expands {name: [values...]} into one full parameter dict per grid point.
+
+    Parameters missing from both the grid and base_params take the defaults of
+    run_point_to_point_simulation, so equal points always get the same point_id.
+    """
+    base_params = dict(base_params or {})
+    for name in list(parameter_grid) + list(base_params):
+        if name not in SWEEPABLE_PARAMETERS:
+            raise ValueError(f"Unknown sweep parameter '{name}'. Expected one of {SWEEPABLE_PARAMETERS}.")
+
+    names = sorted(parameter_grid)
+    points = []
+    for values in itertools.product(*(parameter_grid[name] for name in names)):
+        point = dict(DEFAULT_PARAMETERS)
+        point.update(base_params)
+        point.update(zip(names, values))
+        points.append(point)
+    return points
+
+def point_id(params):
+    """Stable identifier of a grid point, used to resume a sweep."""
+    canonical = json.dumps(params, sort_keys=True, default=float)
+    return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+def _point_seed(base_seed, params_id):
+    return int(hashlib.sha256(f"{base_seed}:{params_id}".encode()).hexdigest()[:16], 16)
+
+def _run_sweep_point(params, seed, cache_dir=None):
+    """Worker entry point: simulates one grid point quietly and returns its result record."""
+    start_time = time.perf_counter()
+    # workers share results only through the disk tier
+    cache = LinkResultCache(directory=cache_dir) if cache_dir is not None else None
+    with contextlib.redirect_stdout(io.StringIO()):
+        sifted_key_length, qber = run_point_to_point_simulation(seed=seed, cache=cache, **params)
+    elapsed_s = time.perf_counter() - start_time
+
+    num_pulses = params['num_pulses_per_link']
+    record = dict(params)
+    record.update({
+        'point_id': point_id(params),
+        'seed': seed,
+        'sifted_key_length': sifted_key_length,
+        'qber': qber,
+        'sifted_rate_per_pulse': sifted_key_length / num_pulses if num_pulses > 0 else 0.0,
+        'elapsed_s': elapsed_s,
+    })
+    return record
+
+def _output_format(output_path):
+    extension = os.path.splitext(output_path)[1].lower()
+    if extension == '.jsonl':
+        return 'jsonl'
+    if extension == '.csv':
+        return 'csv'
+    raise ValueError("Sweep output must be a .jsonl or .csv file.")
+
+def truncate_partial_record(output_path):
+    """Cuts an output file back to its last complete line, dropping a record cut short by an interrupted run."""
+    if not os.path.exists(output_path):
+        return
+    with open(output_path, 'rb+') as output_file:
+        output_file.seek(0, os.SEEK_END)
+        end = output_file.tell()
+        position = end
+        while position > 0:
+            block_start = max(position - 4096, 0)
+            output_file.seek(block_start)
+            last_newline = output_file.read(position - block_start).rfind(b'\n')
+            if last_newline >= 0:
+                position = block_start + last_newline + 1
+                break
+            position = block_start
+        if position < end:
+            output_file.truncate(position)
+
+def load_finished_point_ids(output_path):
+    """Returns the point ids already recorded in a sweep output file."""
+    if not os.path.exists(output_path):
+        return set()
+
+    with open(output_path, newline='') as output_file:
+        if _output_format(output_path) == 'jsonl':
+            finished = set()
+            for line in output_file:
+                try:
+                    finished.add(json.loads(line)['point_id'])
+                except (ValueError, KeyError):
+                    continue
+            return finished
+        return {row['point_id'] for row in csv.DictReader(output_file) if row.get('point_id')}
+
+def expected_sifted_rate(params):
+    """Analytic sifted bits per pulse of a grid point, used to screen points before simulating them."""
+    return estimate_point_to_point(
+        params['num_pulses_per_link'], params['distance_km'], params['mu'], params['detector_efficiency'],
+        params['dark_count_rate_per_ns'], params['pulse_repetition_rate_ns']
+    )['sifted_rate_per_pulse']
+
+def run_parameter_sweep(parameter_grid, output_path, base_params=None, max_workers=None, seed=0, resume=True,
+                        min_expected_sifted_rate=None, cache_dir=None):
+    """Simulates every point of parameter_grid on a worker pool, streaming records to output_path.
+
+    Records are appended to a .jsonl or .csv file as soon as each point finishes.
+    With resume=True, a record cut short by an interrupted run is dropped and points
+    already present in output_path are skipped. Every point
+    gets a seed derived from seed and its parameters, so a resumed sweep reproduces
+    the same numbers. With min_expected_sifted_rate set, points whose analytic sifted
+    rate per pulse falls below it are skipped without simulating. With cache_dir set,
+    link results are cached on disk there, so a repeated sweep with the same seed reuses
+    them even into a new output file. Returns the records computed by this call.
+    """
+    output_format = _output_format(output_path)
+    points = expand_parameter_grid(parameter_grid, base_params)
+
+    if resume:
+        truncate_partial_record(output_path)
+    finished_ids = load_finished_point_ids(output_path) if resume else set()
+    pending_points = [point for point in points if point_id(point) not in finished_ids]
+
+    num_finished = len(points) - len(pending_points)
+    num_screened = 0
+    if min_expected_sifted_rate is not None:
+        screened_points = [point for point in pending_points if expected_sifted_rate(point) >= min_expected_sifted_rate]
+        num_screened = len(pending_points) - len(screened_points)
+        pending_points = screened_points
+
+    print(f"Sweep: {len(points)} points, {num_finished} already finished, {num_screened} screened out, "
+          f"{len(pending_points)} to simulate.")
+    if not pending_points:
+        return []
+
+    fieldnames = SWEEPABLE_PARAMETERS + RESULT_FIELDS
+    write_header = not resume or not os.path.exists(output_path) or os.path.getsize(output_path) == 0
+    if output_format == 'csv' and not write_header:
+        with open(output_path, newline='') as existing_file:
+            if next(csv.reader(existing_file)) != fieldnames:
+                raise ValueError(f"{output_path} was written with different sweep parameters and cannot be resumed.")
+
+    records = []
+    with open(output_path, 'a' if resume else 'w', newline='') as output_file, \
+            ProcessPoolExecutor(max_workers=max_workers) as executor:
+        if output_format == 'csv':
+            writer = csv.DictWriter(output_file, fieldnames=fieldnames)
+            if write_header:
+                writer.writeheader()
+
+        futures = [executor.submit(_run_sweep_point, point, _point_seed(seed, point_id(point)), cache_dir)
+                   for point in pending_points]
+
+        for future in as_completed(futures):
+            record = future.result()
+            if output_format == 'csv':
+                writer.writerow(record)
+            else:
+                output_file.write(json.dumps(record) + '\n')
+            output_file.flush()
+            records.append(record)
+            print(f"Sweep point {len(records)}/{len(pending_points)} done: "
+                  f"key length {record['sifted_key_length']}, QBER {record['qber']:.4f}")
+
+    return records
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a point-to-point QKD parameter sweep.")
+    parser.add_argument('grid', help="JSON file mapping parameter names to lists of values.")
+    parser.add_argument('output', help="Result file (.jsonl or .csv); an existing file is resumed.")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-resume', action='store_true')
+    parser.add_argument('--min-expected-rate', type=float, default=None,
+                        help="Skip points whose analytic sifted rate per pulse is below this value.")
+    parser.add_argument('--cache-dir', default=None, help="Directory of the on-disk link result cache.")
+    args = parser.parse_args()
+
+    with open(args.grid) as grid_file:
+        grid = json.load(grid_file)
+
+    run_parameter_sweep(grid, args.output, max_workers=args.workers, seed=args.seed, resume=not args.no_resume,
+                        min_expected_sifted_rate=args.min_expected_rate, cache_dir=args.cache_dir)
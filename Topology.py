@@ -0,0 +1,109 @@
+import heapq
+import math
+
+ROUTING_METRICS = ('loss', 'key_rate')
+
+class Topology:
+    """Adjacency index of a network with cached shortest-path routing.
+
+    Links are stored in both directions, each direction with its own weight per routing
+    metric. Shortest-path trees are computed with Dijkstra per (source, metric) on first
+    use and cached. Adding or removing a link only drops the cached trees it can change:
+    a removal matters only to trees that route over the link, and an addition only to
+    trees where the link gives a shorter way to one of its ends.
+    """
+
+    def __init__(self):
+        self.adjacency = {}
+        self._routing_tables = {}
+
+    def add_node(self, node_id):
+        self.adjacency.setdefault(node_id, {})
+
+    def neighbors(self, node_id):
+        return list(self.adjacency.get(node_id, {}))
+
+    def has_link(self, node1_id, node2_id):
+        return node2_id in self.adjacency.get(node1_id, {})
+
+    def add_link(self, node1_id, node2_id, forward_weights, backward_weights=None):
+        """Links two nodes; forward_weights and backward_weights map metric -> weight for each direction."""
+        if node1_id == node2_id:
+            raise ValueError("A link must connect two different nodes.")
+        if backward_weights is None:
+            backward_weights = forward_weights
+        for weights in (forward_weights, backward_weights):
+            if set(weights) != set(ROUTING_METRICS):
+                raise ValueError(f"Link weights must be given for exactly the metrics {ROUTING_METRICS}.")
+
+        self.add_node(node1_id)
+        self.add_node(node2_id)
+        self.adjacency[node1_id][node2_id] = dict(forward_weights)
+        self.adjacency[node2_id][node1_id] = dict(backward_weights)
+        self._invalidate_routes(
+            lambda metric, distances, predecessors:
+                distances.get(node1_id, math.inf) + forward_weights[metric] < distances.get(node2_id, math.inf)
+                or distances.get(node2_id, math.inf) + backward_weights[metric] < distances.get(node1_id, math.inf)
+                # replacing an existing link can also make it longer
+                or predecessors.get(node2_id) == node1_id or predecessors.get(node1_id) == node2_id
+        )
+
+    def remove_link(self, node1_id, node2_id):
+        if not self.has_link(node1_id, node2_id):
+            raise ValueError(f"No link between {node1_id} and {node2_id}.")
+        del self.adjacency[node1_id][node2_id]
+        del self.adjacency[node2_id][node1_id]
+        self._invalidate_routes(
+            lambda metric, distances, predecessors:
+                predecessors.get(node2_id) == node1_id or predecessors.get(node1_id) == node2_id
+        )
+
+    def _invalidate_routes(self, is_affected):
+        """Drops the cached routing tables for which is_affected(metric, distances, predecessors) holds."""
+        for cache_key in [cache_key for cache_key, (distances, predecessors) in self._routing_tables.items()
+                          if is_affected(cache_key[1], distances, predecessors)]:
+            del self._routing_tables[cache_key]
+
+    def routing_table(self, source_id, metric='loss'):
+        """Shortest-path distances and predecessors from source_id, as two dicts over reachable nodes."""
+        if metric not in ROUTING_METRICS:
+            raise ValueError(f"Unknown routing metric '{metric}'. Expected one of {ROUTING_METRICS}.")
+        if source_id not in self.adjacency:
+            raise ValueError(f"Node {source_id} is not in the topology.")
+
+        cache_key = (source_id, metric)
+        if cache_key not in self._routing_tables:
+            self._routing_tables[cache_key] = self._dijkstra(source_id, metric)
+        return self._routing_tables[cache_key]
+
+    def _dijkstra(self, source_id, metric):
+        distances = {source_id: 0.0}
+        predecessors = {source_id: None}
+        settled = set()
+        # the counter breaks distance ties without comparing node ids of mixed types
+        frontier = [(0.0, 0, source_id)]
+        pushes = 1
+        while frontier:
+            distance, _, node_id = heapq.heappop(frontier)
+            if node_id in settled:
+                continue
+            settled.add(node_id)
+            for neighbor_id, weights in self.adjacency[node_id].items():
+                candidate = distance + weights[metric]
+                if candidate < distances.get(neighbor_id, math.inf):
+                    distances[neighbor_id] = candidate
+                    predecessors[neighbor_id] = node_id
+                    heapq.heappush(frontier, (candidate, pushes, neighbor_id))
+                    pushes += 1
+        return distances, predecessors
+
+    def shortest_path(self, source_id, target_id, metric='loss'):
+        """Node ids along the cheapest route from source_id to target_id, both included."""
+        distances, predecessors = self.routing_table(source_id, metric)
+        if target_id not in distances:
+            raise ValueError(f"No route from {source_id} to {target_id}.")
+
+        path = [target_id]
+        while path[-1] != source_id:
+            path.append(predecessors[path[-1]])
+        return path[::-1]
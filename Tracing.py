@@ -0,0 +1,84 @@
+import numpy as np
+
+TRACE_OFF = 'off'
+TRACE_COUNTERS = 'counters'
+TRACE_SAMPLED = 'sampled'
+TRACE_FULL = 'full'
+TRACE_LEVELS = (TRACE_OFF, TRACE_COUNTERS, TRACE_SAMPLED, TRACE_FULL)
+
+DEFAULT_TRACE_CAPACITY = 2**16
+DEFAULT_TRACE_SAMPLE_EVERY = 1000
+
+def validate_trace_settings(trace_level, trace_capacity, trace_sample_every):
+    if trace_level not in TRACE_LEVELS:
+        raise ValueError(f"Unknown trace level '{trace_level}'. Expected one of {TRACE_LEVELS}.")
+    if trace_capacity <= 0:
+        raise ValueError("Trace capacity must be a positive number of records.")
+    if trace_sample_every <= 0:
+        raise ValueError("Trace sampling interval must be a positive number of slots.")
+
+class TraceBuffer:
+    """Fixed-capacity ring buffer of structured records; the oldest records are overwritten."""
+
+    def __init__(self, dtype, capacity):
+        self.records = np.zeros(capacity, dtype=dtype)
+        self.capacity = capacity
+        self.total_written = 0
+
+    def __len__(self):
+        return min(self.total_written, self.capacity)
+
+    def clear(self):
+        self.total_written = 0
+
+    def append(self, **fields):
+        self.records[self.total_written % self.capacity] = tuple(fields[name] for name in self.records.dtype.names)
+        self.total_written += 1
+
+    def append_columns(self, columns):
+        """Appends a batch given as {field: array}; only the last `capacity` records are kept."""
+        num_records = len(columns[self.records.dtype.names[0]])
+        skipped = max(num_records - self.capacity, 0)
+        first_written = self.total_written + skipped
+        rows = (first_written + np.arange(num_records - skipped)) % self.capacity
+        for name in self.records.dtype.names:
+            self.records[name][rows] = np.asarray(columns[name])[skipped:]
+        self.total_written += num_records
+
+    def lookup(self, field, value):
+        """Returns the most recent record whose field equals value, or None.
+
+        Traces are written in time order, so when field is evenly spaced across the
+        retained records (as time slots are) the record's position follows from the
+        oldest and newest values; otherwise the retained records are searched.
+        """
+        if not self.total_written:
+            return None
+        first_retained = max(self.total_written - self.capacity, 0)
+        column = self.records[field]
+        first_value = column[first_retained % self.capacity]
+        last_value = column[(self.total_written - 1) % self.capacity]
+        num_retained = self.total_written - first_retained
+        if num_retained > 1 and last_value != first_value:
+            record_number = first_retained + round((value - first_value) * (num_retained - 1)
+                                                   / (last_value - first_value))
+            if first_retained <= record_number < self.total_written:
+                record = self.records[record_number % self.capacity]
+                if record[field] == value:
+                    return record
+
+        matches = np.flatnonzero(self.to_array()[field] == value)
+        if not len(matches):
+            return None
+        return self.records[(first_retained + matches[-1]) % self.capacity]
+
+    def to_array(self):
+        """The retained records as a new array, oldest first."""
+        if self.total_written <= self.capacity:
+            return self.records[:self.total_written].copy()
+        row = self.total_written % self.capacity
+        return np.concatenate((self.records[row:], self.records[:row]))
+
+def record_to_dict(record):
+    """Converts one structured trace record into a plain dict of Python values."""
+    return {name: record[name].item() for name in record.dtype.names}
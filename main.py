@@ -1,4 +1,5 @@
 from Network import Network
+from Keys import as_packed_key
 
 import math 
 
@@ -7,20 +8,19 @@ def calculate_qber(alice_sifted_key, bob_sifted_key):
     if len(alice_sifted_key) != len(bob_sifted_key):
         raise ValueError("Sifted keys must be of the same length to calculate QBER.")
 
-    if not alice_sifted_key: 
+    if not len(alice_sifted_key): 
         return 0.0, 0
 
-    num_errors = 0
-    for i in range(len(alice_sifted_key)):
-        if alice_sifted_key[i] != bob_sifted_key[i]:
-            num_errors += 1
+    # vectorized XOR + popcount over the packed bytes
+    num_errors = (as_packed_key(alice_sifted_key) ^ as_packed_key(bob_sifted_key)).popcount()
     
     qber = num_errors / len(alice_sifted_key)
     return qber, num_errors
 
 def run_point_to_point_simulation(num_pulses_per_link=10000, distance_km=20, mu=0.2,
                                   detector_efficiency=0.9, dark_count_rate_per_ns=1e-7,
-                                  pulse_repetition_rate_ns=1):
+                                  pulse_repetition_rate_ns=1, chunk_size=None, seed=None, sampling='full',
+                                  cache=None, dead_time_ns=0.0, afterpulse_probability=0.0):
 
     print("\n--- Running Point-to-Point QKD Simulation ---")
     
@@ -28,14 +28,16 @@ def run_point_to_point_simulation(num_pulses_per_link=10000, distance_km=20, mu=
     temp_network = Network()
     node_alice = temp_network.add_node('Alice', avg_photon_number=mu)
     node_bob = temp_network.add_node('Bob', detector_efficiency=detector_efficiency,
-                                        dark_count_rate=dark_count_rate_per_ns)
+                                        dark_count_rate=dark_count_rate_per_ns, dead_time_ns=dead_time_ns,
+                                        afterpulse_probability=afterpulse_probability)
     temp_network.connect_nodes('Alice', 'Bob', distance_km=distance_km)
     
     print(f"Simulating point-to-point QKD for {distance_km} km with {num_pulses_per_link} pulses.")
     
 
     alice_raw_sifted_key, bob_raw_sifted_key = node_alice.generate_and_share_key(
-        node_bob, num_pulses_per_link, pulse_repetition_rate_ns
+        node_bob, num_pulses_per_link, pulse_repetition_rate_ns, chunk_size=chunk_size, seed=seed, sampling=sampling,
+        cache=cache
     )
     
 
@@ -63,7 +65,9 @@ def run_point_to_point_simulation(num_pulses_per_link=10000, distance_km=20, mu=
 
 def run_multi_node_trusted_relay_simulation(num_pulses_per_link=10000, link_distance_km=10, num_relays=1,
                                             mu=0.2, detector_efficiency=0.9, dark_count_rate_per_ns=1e-7,
-                                            pulse_repetition_rate_ns=1):
+                                            pulse_repetition_rate_ns=1, chunk_size=None,
+                                            parallel=False, seed=None, sampling='full', cache=None,
+                                            dead_time_ns=0.0, afterpulse_probability=0.0):
     print(f"\n--- Running Multi-Node (Trusted Relay) QKD Simulation with {num_relays} relay(s) ---")
     
     network = Network()
@@ -76,7 +80,8 @@ def run_multi_node_trusted_relay_simulation(num_pulses_per_link=10000, link_dist
 
     for node_id in all_node_ids:
         network.add_node(node_id, avg_photon_number=mu,
-                         detector_efficiency=detector_efficiency, dark_count_rate=dark_count_rate_per_ns)
+                         detector_efficiency=detector_efficiency, dark_count_rate=dark_count_rate_per_ns,
+                         dead_time_ns=dead_time_ns, afterpulse_probability=afterpulse_probability)
  
     for i in range(len(all_node_ids) - 1):
         node1_id = all_node_ids[i]
@@ -87,7 +92,8 @@ def run_multi_node_trusted_relay_simulation(num_pulses_per_link=10000, link_dist
     
 
     final_end_to_end_raw_key = network.establish_end_to_end_raw_key(
-        sender_id, receiver_id, path, num_pulses_per_link, pulse_repetition_rate_ns
+        sender_id, receiver_id, path, num_pulses_per_link, pulse_repetition_rate_ns, chunk_size=chunk_size,
+        parallel=parallel, seed=seed, sampling=sampling, cache=cache
     )
 
     print(f"\n--- Multi-Node Results ({num_relays} relays, {link_distance_km}km per link) ---")
@@ -101,7 +107,8 @@ def run_multi_node_trusted_relay_simulation(num_pulses_per_link=10000, link_dist
         print(f"Total Network Distance: {total_distance_km} km")
         print(f"Total Pulses Generated (sum across links): {total_pulses_generated_across_all_links}")
         
-        total_time_s = (total_pulses_generated_across_all_links * pulse_repetition_rate_ns) / 1e9
+        # the links generate at the same time, so the run lasts as long as one link's pulses
+        total_time_s = (num_pulses_per_link * pulse_repetition_rate_ns) / 1e9
         
         if total_time_s > 0:
             end_to_end_raw_key_rate_bps = len(final_end_to_end_raw_key) / total_time_s
@@ -0,0 +1,81 @@
+from Cache import LinkResultCache, link_cache_key, seed_identity
+from Keys import PackedKey
+from main import run_multi_node_trusted_relay_simulation, run_point_to_point_simulation
+
+import os
+
+import numpy as np
+import pytest
+
+def _entry(seed, length=800):
+    rng = np.random.default_rng(seed)
+    return (PackedKey.from_bits(rng.integers(0, 2, size=length, dtype=np.uint8)),
+            PackedKey.from_bits(rng.integers(0, 2, size=length, dtype=np.uint8)), {'sifted_bits': length})
+
+def test_hit_miss_and_copy_on_return():
+    cache = LinkResultCache()
+    alice_key, bob_key, counters = _entry(0)
+    assert cache.get('a') is None
+    cache.put('a', alice_key, bob_key, counters)
+    alice_key.extend([1])
+    cached = cache.get('a')
+    assert len(cached['alice']) == 800 and cached['bob'] == bob_key and cached['counters'] == counters
+    cached['alice'].extend([1, 1])
+    cached['counters']['sifted_bits'] = 0
+    assert len(cache.get('a')['alice']) == 800
+    assert cache.get('a')['counters'] == counters
+    assert cache.stats == {'memory_hits': 3, 'disk_hits': 0, 'misses': 1, 'evictions': 0}
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = LinkResultCache(max_memory_bytes=450)
+    for name in 'abc':
+        cache.put(name, *_entry(ord(name)))
+        cache.get('a')
+    assert 'a' in cache and 'b' not in cache and 'c' in cache
+    assert cache.memory_bytes == 400
+    assert cache.stats['evictions'] == 1
+
+def test_disk_hits_are_copied_into_memory(tmp_path):
+    cache = LinkResultCache(directory=str(tmp_path))
+    alice_key, bob_key, counters = _entry(1)
+    cache.put('a', alice_key, bob_key, counters)
+    reopened = LinkResultCache(directory=str(tmp_path))
+    cached = reopened.get('a')
+    assert cached['alice'] == alice_key and cached['bob'] == bob_key and cached['counters'] == counters
+    assert reopened.stats['disk_hits'] == 1
+    # nothing in memory may keep the file mapped, so it can still be deleted
+    assert all(type(key._data) is np.ndarray for key in (reopened._memory['a']['alice'], reopened._memory['a']['bob']))
+    assert reopened.get('a')['alice'] == alice_key
+    assert reopened.stats['memory_hits'] == 1
+
+def test_disk_tier_evicts_oldest_and_tolerates_vanished_entries(tmp_path):
+    cache = LinkResultCache(directory=str(tmp_path), max_disk_bytes=400)
+    cache.put('a', *_entry(1))
+    os.utime(cache.store.metadata_path('a-alice'), (0, 0))
+    cache.put('b', *_entry(2))
+    assert cache.store.names() == ['b-alice', 'b-bob']
+    # another process evicts an entry while this one scans the directory
+    cache.store.delete('b-bob')
+    cache.put('c', *_entry(3))
+    assert 'c-alice' in cache.store
+
+def test_seed_identity():
+    assert seed_identity(None) is None
+    assert seed_identity(True) is None
+    assert seed_identity(np.int64(5)) == seed_identity(5)
+    spawned = np.random.SeedSequence(5).spawn(2)
+    assert seed_identity(spawned[0]) != seed_identity(spawned[1])
+    assert link_cache_key({'seed': seed_identity(5)}) == link_cache_key({'seed': seed_identity(5)})
+
+def test_seeded_runs_are_served_from_cache(tmp_path):
+    cache = LinkResultCache(directory=str(tmp_path))
+    first = run_point_to_point_simulation(20000, seed=3, cache=cache)
+    assert run_point_to_point_simulation(20000, seed=3, cache=cache) == first
+    assert run_point_to_point_simulation(20000, seed=3) == first
+    assert cache.stats['memory_hits'] == 1
+
+@pytest.mark.parametrize('parallel', [False, True])
+def test_unseeded_runs_are_not_cached(tmp_path, parallel):
+    cache = LinkResultCache(directory=str(tmp_path))
+    run_multi_node_trusted_relay_simulation(20000, num_relays=2, parallel=parallel, cache=cache)
+    assert cache.store.names() == [] and not cache._memory
@@ -0,0 +1,49 @@
+from ErrorCorrection import cascade, cascade_block_sizes
+from PrivacyAmplification import binary_entropy
+
+import numpy as np
+import pytest
+
+def _noisy_key_pair(key_length, qber, seed):
+    rng = np.random.default_rng(seed)
+    alice_bits = rng.integers(0, 2, size=key_length, dtype=np.uint8)
+    bob_bits = alice_bits ^ (rng.random(key_length) < qber).astype(np.uint8)
+    return alice_bits, bob_bits
+
+@pytest.mark.parametrize('qber', [0.01, 0.03, 0.05])
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_cascade_removes_all_errors(qber, seed):
+    alice_bits, bob_bits = _noisy_key_pair(20000, qber, seed)
+    result = cascade(alice_bits, bob_bits, qber, seed=seed)
+    assert result['residual_errors'] == 0
+    assert result['corrected_key'] == alice_bits
+
+@pytest.mark.parametrize('qber', [0.01, 0.03, 0.05])
+def test_cascade_leakage_is_close_to_shannon_limit(qber):
+    key_length = 50000
+    efficiencies = []
+    for seed in range(5):
+        alice_bits, bob_bits = _noisy_key_pair(key_length, qber, seed)
+        result = cascade(alice_bits, bob_bits, qber, seed=seed)
+        efficiencies.append(result['leaked_bits'] / (key_length * binary_entropy(qber)))
+    # Cascade leaks about 1.1 h2(Q) bits per key bit
+    assert np.mean(efficiencies) == pytest.approx(1.1, rel=0.1)
+
+def test_cascade_without_errors_keeps_the_key():
+    alice_bits, _ = _noisy_key_pair(1000, 0.0, 0)
+    result = cascade(alice_bits, alice_bits.copy(), 0.0)
+    assert result['residual_errors'] == 0
+    assert result['corrected_key'] == alice_bits
+
+def test_block_sizes_double_and_are_capped():
+    assert cascade_block_sizes(0.01, 1000) == [73, 146, 292, 584]
+    assert cascade_block_sizes(0.01, 200) == [73, 146, 200, 200]
+    with pytest.raises(ValueError):
+        cascade_block_sizes(0.5, 1000)
+
+@pytest.mark.parametrize('key_length', [1, 777, 12345, 40001])
+def test_cascade_on_lengths_that_are_not_whole_bytes(key_length):
+    alice_bits, bob_bits = _noisy_key_pair(key_length, 0.05, key_length)
+    result = cascade(alice_bits, bob_bits, 0.05, seed=0)
+    assert result['residual_errors'] == 0
+    assert result['corrected_key'] == alice_bits
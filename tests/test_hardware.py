@@ -0,0 +1,82 @@
+from Hardware import NO_CLICK, OpticalChannel, Receiver, SinglePhotonDetector
+from Source import Sender
+
+import numpy as np
+import pytest
+
+def _dark_only_detector(dead_time_ns, **settings):
+    # a blind detector with a dark count in about half the windows
+    return SinglePhotonDetector(quantum_efficiency=0.0, dark_count_rate_per_ns=0.5, time_window_ns=1,
+                                rng=np.random.default_rng(0), dead_time_ns=dead_time_ns, **settings)
+
+def test_memoryless_detector_counts_every_dark_click():
+    detector = _dark_only_detector(0.0)
+    clicks = detector.detect_array(np.zeros(10000, dtype=np.int64))
+    assert detector.dark_count_clicks == np.count_nonzero(clicks)
+    assert detector.suppressed_clicks == 0
+
+@pytest.mark.parametrize('dead_time_ns', [2.5, 10.0])
+def test_dark_counts_in_the_dead_time_are_not_counted(dead_time_ns):
+    detector = _dark_only_detector(dead_time_ns)
+    times_ns = np.arange(10000, dtype=float)
+    clicks = detector.detect_array(np.zeros(10000, dtype=np.int64), times_ns)
+    assert detector.dark_count_clicks == np.count_nonzero(clicks)
+    assert detector.suppressed_clicks > 0
+    assert np.all(np.diff(times_ns[clicks]) >= dead_time_ns)
+
+def test_scalar_detect_counts_only_registered_dark_clicks():
+    detector = _dark_only_detector(10.0)
+    clicks = [detector.detect(0, time_ns) for time_ns in range(2000)]
+    assert detector.dark_count_clicks == sum(clicks)
+    assert detector.suppressed_clicks > 0
+
+def test_afterpulses_are_counted_separately():
+    detector = SinglePhotonDetector(quantum_efficiency=0.9, dark_count_rate_per_ns=0.0, rng=np.random.default_rng(1),
+                                    dead_time_ns=5.0, afterpulse_probability=0.5, afterpulse_decay_ns=3.0)
+    incident_photons = np.zeros(20000, dtype=np.int64)
+    incident_photons[::100] = 5
+    clicks = detector.detect_array(incident_photons, np.arange(20000, dtype=float))
+    assert detector.dark_count_clicks == 0
+    assert 0 < detector.afterpulse_clicks < np.count_nonzero(clicks)
+
+def _measure_both_ways(num_slots, detector_efficiency, dark_count_rate, seed):
+    """Measures one pulse train slot by slot and in one batch, with independently seeded receivers."""
+    rng = np.random.default_rng(seed)
+    pulses = Sender(0.5, rng=rng).prepare_pulses(num_slots)
+    photons = OpticalChannel(5, rng=rng).transmit_pulses(pulses['photon_count'])
+    phases = pulses['modulated_phase']
+
+    per_slot = Receiver(detector_efficiency, dark_count_rate, rng=np.random.default_rng(seed + 1))
+    slot_results = [per_slot.receive_and_measure(i, photons[i], phases[i], photons[i - 1] if i else 0,
+                                                 phases[i - 1] if i else 0.0)
+                    for i in range(num_slots)]
+    batch = Receiver(detector_efficiency, dark_count_rate,
+                     rng=np.random.default_rng(seed + 2)).measure_pulses(pulses['time_slot'], photons, phases)
+    slot_columns = {
+        'click_dm1': np.array([result[0] for result in slot_results]),
+        'click_dm2': np.array([result[1] for result in slot_results]),
+        'bob_inferred_bit': np.array([NO_CLICK if result[3] is None else result[3] for result in slot_results]),
+    }
+    return slot_columns, batch, phases
+
+def test_ideal_detectors_measure_identically_per_slot_and_in_batch():
+    slot_columns, batch, _ = _measure_both_ways(5000, 1.0, 0.0, seed=0)
+    assert np.count_nonzero(batch['click_dm1']) and np.count_nonzero(batch['click_dm2'])
+    for name, column in slot_columns.items():
+        assert np.array_equal(column, batch[name])
+
+def test_batch_measurement_matches_per_slot_statistics():
+    slot_columns, batch, phases = _measure_both_ways(100000, 0.6, 5e-3, seed=1)
+    for columns in (slot_columns, batch):
+        columns['double_click'] = columns['click_dm1'] & columns['click_dm2']
+    for name in ('click_dm1', 'click_dm2', 'double_click'):
+        slot_rate, batch_rate = slot_columns[name].mean(), batch[name].mean()
+        assert abs(slot_rate - batch_rate) < 5 * np.sqrt(2 * slot_rate * (1 - slot_rate) / 100000)
+    # among clicked slots, the share of bits that disagree with the phase difference Alice sent
+    error_rates = []
+    for columns in (slot_columns, batch):
+        bits = columns['bob_inferred_bit']
+        clicked = bits[1:] != NO_CLICK
+        sent_bits = (np.diff(phases) != 0)[clicked]
+        error_rates.append(np.mean(bits[1:][clicked] != sent_bits))
+    assert abs(error_rates[0] - error_rates[1]) < 0.01
@@ -0,0 +1,97 @@
+from Keys import PackedKey
+
+import numpy as np
+import pytest
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+@pytest.mark.parametrize('first_length', [0, 1, 7, 8, 9, 63, 64, 100])
+@pytest.mark.parametrize('second_length', [0, 1, 7, 8, 13, 200])
+def test_extend_matches_concatenation(rng, first_length, second_length):
+    first_bits = rng.integers(0, 2, size=first_length, dtype=np.uint8)
+    second_bits = rng.integers(0, 2, size=second_length, dtype=np.uint8)
+    key = PackedKey.from_bits(first_bits)
+    key.extend(PackedKey.from_bits(second_bits))
+    assert len(key) == first_length + second_length
+    assert np.array_equal(key.to_bits(), np.concatenate((first_bits, second_bits)))
+    # the zero-tail invariant lets whole-byte operations ignore the key length
+    assert key.popcount() == int(first_bits.sum()) + int(second_bits.sum())
+
+def test_repeated_extend_and_append(rng):
+    bits = rng.integers(0, 2, size=1000, dtype=np.uint8)
+    key = PackedKey()
+    position = 0
+    for chunk_length in [3, 5, 1, 17, 64, 9, 200]:
+        key.extend(bits[position:position + chunk_length].tolist())
+        position += chunk_length
+    key.append(1)
+    assert np.array_equal(key.to_bits(), np.append(bits[:position], 1))
+
+@pytest.mark.parametrize('start, stop', [(0, 100), (8, 64), (3, 77), (5, 6), (40, 40), (-30, None), (None, -9)])
+def test_slicing_matches_bits(rng, start, stop):
+    bits = rng.integers(0, 2, size=100, dtype=np.uint8)
+    key = PackedKey.from_bits(bits)
+    part = key[start:stop]
+    assert np.array_equal(part.to_bits(), bits[start:stop])
+    assert part.popcount() == int(bits[start:stop].sum())
+    assert key[::3] == bits[::3].tolist()
+
+def test_slices_do_not_share_memory(rng):
+    key = PackedKey.from_bits(rng.integers(0, 2, size=64, dtype=np.uint8))
+    part = key[8:40]
+    part.extend([1, 1, 1])
+    assert len(key) == 64
+    assert key[8:40] == part[:32]
+
+def test_indexing_and_xor(rng):
+    alice_bits = rng.integers(0, 2, size=77, dtype=np.uint8)
+    bob_bits = rng.integers(0, 2, size=77, dtype=np.uint8)
+    alice_key = PackedKey.from_bits(alice_bits)
+    assert [alice_key[index] for index in range(77)] == alice_bits.tolist()
+    assert alice_key[-1] == alice_bits[-1]
+    with pytest.raises(IndexError):
+        alice_key[77]
+    assert (alice_key ^ PackedKey.from_bits(bob_bits)) == (alice_bits ^ bob_bits).tolist()
+    with pytest.raises(ValueError):
+        alice_key ^ alice_key[:10]
+
+def test_read_only_keys_copy_on_extend(rng):
+    data = np.packbits(rng.integers(0, 2, size=16, dtype=np.uint8))
+    data.flags.writeable = False
+    key = PackedKey.from_packed(data, 16)
+    key.extend([1, 0, 1])
+    assert len(key) == 19
+    assert np.array_equal(data, np.packbits(key.to_bits()[:16]))
+
+def test_pop_prefix_leaves_the_remaining_bits(rng):
+    bits = rng.integers(0, 2, size=300, dtype=np.uint8)
+    key = PackedKey.from_bits(bits)
+    position = 0
+    for num_bits in [3, 0, 5, 8, 13, 1, 7, 64]:
+        assert key.pop_prefix(num_bits) == bits[position:position + num_bits].tolist()
+        position += num_bits
+        assert len(key) == len(bits) - position
+        assert key[2] == bits[position + 2]
+        assert key[10:50] == bits[position + 10:position + 50].tolist()
+    assert key.popcount() == int(bits[position:].sum())
+    key.extend([1, 0, 1])
+    assert key == np.concatenate((bits[position:], [1, 0, 1])).tolist()
+    assert key.pop_prefix(len(key))[-3:] == [1, 0, 1]
+    assert len(key) == 0
+    with pytest.raises(ValueError):
+        key.pop_prefix(1)
+
+@pytest.mark.parametrize('num_bits', [1, 6, 9])
+def test_popped_keys_work_with_whole_byte_operations(rng, num_bits):
+    alice_bits = rng.integers(0, 2, size=100, dtype=np.uint8)
+    bob_bits = rng.integers(0, 2, size=100 - num_bits, dtype=np.uint8)
+    alice_key = PackedKey.from_bits(alice_bits)
+    alice_key.pop_prefix(num_bits)
+    assert (alice_key ^ PackedKey.from_bits(bob_bits)) == (alice_bits[num_bits:] ^ bob_bits).tolist()
+    assert alice_key.tobytes() == np.packbits(alice_bits[num_bits:]).tobytes()
+    assert alice_key.copy() == alice_bits[num_bits:].tolist()
+    other_key = PackedKey.from_bits(bob_bits)
+    other_key.extend(alice_key)
+    assert other_key == np.concatenate((bob_bits, alice_bits[num_bits:])).tolist()
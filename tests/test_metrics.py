@@ -0,0 +1,50 @@
+from Metrics import StageMetrics, metrics_to_prometheus
+from Network import Network
+
+import pytest
+
+@pytest.fixture
+def chain():
+    network = Network()
+    for node_id in 'ABC':
+        network.add_node(node_id, dark_count_rate=1e-3)
+    network.connect_nodes('A', 'B', 10)
+    network.connect_nodes('B', 'C', 10)
+    network.establish_end_to_end_raw_key('A', 'C', ['A', 'B', 'C'], 20000, 1, seed=1)
+    return network
+
+def test_nodes_are_credited_by_role(chain):
+    snapshot = chain.metrics_snapshot()
+    sender, relay, receiver = (snapshot['nodes'][node_id]['counters'] for node_id in 'ABC')
+    links = snapshot['links']
+    assert 'clicks_dm1' not in sender
+    assert 'photons_sent' not in receiver
+    assert relay['photons_sent'] == links['B->C']['counters']['photons_sent']
+    assert relay['clicks_dm1'] == links['A->B']['counters']['clicks_dm1']
+    assert relay['sessions'] == 2
+    assert 'measurement' not in snapshot['nodes']['A']['stage_seconds']
+
+def test_prometheus_scopes_use_separate_families(chain):
+    lines = chain.export_metrics_prometheus().splitlines()
+    assert 'qkd_node_photons_sent_total{node="B"} ' + str(
+        chain.nodes['B'].metrics.counters['photons_sent']) in lines
+    assert any(line.startswith('qkd_link_photons_sent_total{link="A->B"}') for line in lines)
+    assert any(line.startswith('qkd_run_photons_sent_total{run="A->C",run_index="0"}') for line in lines)
+    assert not any(line.startswith('qkd_photons_sent_total') for line in lines)
+
+def test_unknown_names_are_rejected():
+    metrics = StageMetrics(node='A')
+    with pytest.raises(ValueError):
+        metrics.increment('photon_sent')
+    with pytest.raises(ValueError):
+        with metrics.time_stage('decoding'):
+            pass
+    with pytest.raises(ValueError):
+        metrics.merge(StageMetrics(), role='relay')
+
+def test_prometheus_text_format():
+    metrics = StageMetrics(node='A')
+    metrics.increment('pulses', 5)
+    text = metrics_to_prometheus({'node': [metrics]})
+    assert '# TYPE qkd_node_pulses_total counter\nqkd_node_pulses_total{node="A"} 5\n' in text
+    assert 'qkd_node_elapsed_seconds_total{node="A"} 0\n' in text
@@ -0,0 +1,48 @@
+from Keys import PackedKey
+from Network import Network
+
+import numpy as np
+import pytest
+
+PATH = ['A', 'B', 'C', 'D']
+HOP_KEY_LENGTHS = [300, 173, 250]
+
+@pytest.fixture
+def chain():
+    """A three-hop chain whose neighbors share error-free keys of HOP_KEY_LENGTHS bits."""
+    network = Network()
+    for node_id in PATH:
+        network.add_node(node_id)
+    rng = np.random.default_rng(0)
+    for node1_id, node2_id, key_length in zip(PATH[:-1], PATH[1:], HOP_KEY_LENGTHS):
+        network.connect_nodes(node1_id, node2_id, 10)
+        key = PackedKey.from_bits(rng.integers(0, 2, size=key_length, dtype=np.uint8))
+        network.nodes[node1_id].shared_keys[node2_id] = key
+        network.nodes[node2_id].shared_keys[node1_id] = key.copy()
+    return network
+
+def test_relay_delivers_identical_copies_of_the_shortest_hop_length(chain):
+    sender_key, receiver_key = chain.relay_key_along_path(PATH, rng=np.random.default_rng(1))
+    assert len(sender_key) == min(HOP_KEY_LENGTHS)
+    assert sender_key == receiver_key
+    assert chain.nodes['A'].end_to_end_keys['D'] == chain.nodes['D'].end_to_end_keys['A'] == sender_key
+
+def test_relay_consumes_key_length_bits_at_both_ends_of_every_hop(chain):
+    chain.relay_key_along_path(PATH, key_length=100, rng=np.random.default_rng(1))
+    chain.relay_key_along_path(PATH, key_length=50, rng=np.random.default_rng(2))
+    for node1_id, node2_id, key_length in zip(PATH[:-1], PATH[1:], HOP_KEY_LENGTHS):
+        for node_id, neighbor_id in ((node1_id, node2_id), (node2_id, node1_id)):
+            node = chain.nodes[node_id]
+            assert node.key_consumed[neighbor_id] == 150
+            assert len(node.shared_keys[neighbor_id]) == key_length - 150
+    assert chain.nodes['B'].shared_keys['C'] == chain.nodes['C'].shared_keys['B']
+    with pytest.raises(ValueError):
+        chain.relay_key_along_path(PATH, key_length=24)
+
+def test_hop_key_errors_reach_the_receiver_copy(chain):
+    hop_key = chain.nodes['C'].shared_keys['B']
+    error_positions = [3, 64, 170]
+    chain.nodes['C'].shared_keys['B'] = hop_key ^ PackedKey.from_bits(np.isin(np.arange(len(hop_key)),
+                                                                              error_positions))
+    sender_key, receiver_key = chain.relay_key_along_path(PATH, rng=np.random.default_rng(1))
+    assert np.flatnonzero((sender_key ^ receiver_key).to_bits()).tolist() == error_positions
@@ -0,0 +1,39 @@
+from Keys import PackedKey
+from PrivacyAmplification import amplify_privacy, binary_entropy, secret_key_length, toeplitz_hash
+
+import numpy as np
+import pytest
+
+def _dense_toeplitz_hash(key_bits, output_length, seed):
+    key_length = len(key_bits)
+    diagonal_bits = np.random.default_rng(seed).integers(0, 2, size=key_length + output_length - 1, dtype=np.uint8)
+    rows, columns = np.indices((output_length, key_length))
+    matrix = diagonal_bits[rows - columns + key_length - 1].astype(np.int64)
+    return (matrix @ key_bits.astype(np.int64)) % 2
+
+@pytest.mark.parametrize('key_length, output_length', [(1, 1), (50, 20), (301, 150), (513, 512), (1000, 999), (1024, 1)])
+def test_fft_hash_matches_dense_toeplitz_product(key_length, output_length):
+    key_bits = np.random.default_rng(key_length).integers(0, 2, size=key_length, dtype=np.uint8)
+    hashed = toeplitz_hash(PackedKey.from_bits(key_bits), output_length, seed=7)
+    assert hashed == _dense_toeplitz_hash(key_bits, output_length, 7).tolist()
+
+def test_secret_key_length():
+    assert binary_entropy(0.0) == 0.0
+    assert binary_entropy(0.5) == pytest.approx(1.0)
+    assert secret_key_length(10000, 0.0, 0, 2**-10) == 10000 - 20
+    assert secret_key_length(100, 0.1, 90) == 0
+    with pytest.raises(ValueError):
+        secret_key_length(100, 0.0, 0, 1.0)
+
+def test_whole_key_is_hashed_by_default():
+    key_bits = np.random.default_rng(0).integers(0, 2, size=3000, dtype=np.uint8)
+    result = amplify_privacy(key_bits, 0.02, 500, seed=3)
+    assert result['secret_length'] == secret_key_length(3000, 0.02, 500)
+    assert result['secret_key'] == _dense_toeplitz_hash(key_bits, result['secret_length'], 3).tolist()
+
+def test_blocked_hashing_is_shorter_and_deterministic():
+    key_bits = np.random.default_rng(1).integers(0, 2, size=5000, dtype=np.uint8)
+    whole = amplify_privacy(key_bits, 0.02, 500, seed=3)
+    blocked = amplify_privacy(key_bits, 0.02, 500, seed=3, block_size=1024)
+    assert len(blocked['secret_key']) == blocked['secret_length'] < whole['secret_length']
+    assert blocked['secret_key'] == amplify_privacy(key_bits, 0.02, 500, seed=3, block_size=1024)['secret_key']
@@ -0,0 +1,36 @@
+from Network import Network
+from Sampling import bernoulli_positions
+
+import numpy as np
+import pytest
+
+NUM_SEEDS = 20
+NUM_PULSES = 200000
+
+def _session_statistics(sampling, seeds):
+    """Sifted-bit rate, QBER and dark-count click rate of one session per seed."""
+    network = Network()
+    network.add_node('A')
+    network.add_node('B', dark_count_rate=2e-4)
+    network.connect_nodes('A', 'B', 25)
+    alice, bob = network.nodes['A'], network.nodes['B']
+    statistics = []
+    for seed in seeds:
+        alice_key, bob_key = alice.generate_and_share_key(bob, NUM_PULSES, 1, chunk_size=50000, seed=seed,
+                                                          sampling=sampling)
+        statistics.append((len(alice_key) / NUM_PULSES, (alice_key ^ bob_key).popcount() / len(alice_key),
+                           alice.last_session_metrics.counters['dark_count_clicks'] / NUM_PULSES))
+    return np.array(statistics)
+
+def test_event_skipping_matches_full_sampling():
+    full = _session_statistics('full', range(NUM_SEEDS))
+    skipped = _session_statistics('event_skipping', range(NUM_SEEDS, 2 * NUM_SEEDS))
+    standard_error = np.sqrt((full.var(axis=0) + skipped.var(axis=0)) / NUM_SEEDS)
+    assert np.all(np.abs(full.mean(axis=0) - skipped.mean(axis=0)) < 4 * standard_error)
+
+@pytest.mark.parametrize('probability', [0.001, 0.3, 0.9])
+def test_bernoulli_positions_have_the_expected_rate(probability):
+    rng = np.random.default_rng(0)
+    positions = bernoulli_positions(rng, probability, 1000, 201000)
+    assert np.all(np.diff(positions) > 0) and positions[0] >= 1000 and positions[-1] < 201000
+    assert abs(len(positions) - 200000 * probability) < 5 * np.sqrt(200000 * probability)
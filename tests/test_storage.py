@@ -0,0 +1,66 @@
+from Keys import PackedKey
+from Network import Network
+from Storage import KeyStore, open_trace
+
+import numpy as np
+import pytest
+
+@pytest.fixture
+def store(tmp_path):
+    return KeyStore(str(tmp_path))
+
+@pytest.mark.parametrize('chunk_lengths', [[0], [8], [13], [3, 5, 16, 1], [7, 7, 7, 7, 100], [64, 9, 1000]])
+def test_appended_chunks_read_back(store, chunk_lengths):
+    bits = np.random.default_rng(len(chunk_lengths)).integers(0, 2, size=sum(chunk_lengths), dtype=np.uint8)
+    with store.writer('key', {'node': 'A'}) as key_writer:
+        position = 0
+        for chunk_length in chunk_lengths:
+            key_writer.append(PackedKey.from_bits(bits[position:position + chunk_length]))
+            position += chunk_length
+    assert store.metadata('key') == {'node': 'A', 'length': len(bits)}
+    assert store.open('key') == bits.tolist()
+    assert store.open('key', 5, 30) == bits[5:30].tolist()
+
+def test_large_appends_are_written_in_slices(store, monkeypatch):
+    monkeypatch.setattr('Storage.WRITE_SLICE_BYTES', 4)
+    bits = np.random.default_rng(0).integers(0, 2, size=1001, dtype=np.uint8)
+    with store.writer('key') as key_writer:
+        key_writer.append(bits[:333])
+        key_writer.append(bits[333:])
+        key_writer.append(bits[:0])
+    assert store.open('key') == bits.tolist()
+
+def _link(trace_level='counters'):
+    network = Network()
+    network.add_node('A', trace_level=trace_level)
+    network.add_node('B', trace_level=trace_level)
+    network.connect_nodes('A', 'B', 10)
+    return network.nodes['A'], network.nodes['B']
+
+@pytest.mark.parametrize('sampling', ['full', 'event_skipping'])
+def test_session_streams_sifted_keys_into_store(store, sampling):
+    alice, bob = _link()
+    alice.generate_and_share_key(bob, 20000, 1, chunk_size=3000, seed=5, sampling=sampling)
+    expected = alice.shared_keys['B'].copy(), bob.shared_keys['A'].copy()
+
+    alice.generate_and_share_key(bob, 20000, 1, chunk_size=3000, seed=5, sampling=sampling, key_store=store)
+    assert store.names() == ['A--B', 'B--A']
+    assert store.metadata('A--B') == {'node': 'A', 'neighbor': 'B', 'length': len(expected[0])}
+    assert store.open('A--B') == expected[0] and store.open('B--A') == expected[1]
+    assert not alice.shared_keys['B']._data.flags.writeable
+    assert bob.shared_keys['A'] == expected[1]
+
+def test_session_streams_traces(tmp_path):
+    alice, bob = _link(trace_level='full')
+    alice.generate_and_share_key(bob, 5000, 2, chunk_size=700, seed=1, trace_directory=str(tmp_path))
+    sent = open_trace(str(tmp_path / 'A--B' / 'sender'))
+    measured = open_trace(str(tmp_path / 'A--B' / 'receiver'))
+    assert len(sent['time_slot']) == len(measured['time_slot']) == 5000
+    assert sent['time_slot'].tolist() == (2 * np.arange(5000)).tolist()
+    assert np.array_equal(sent['photon_count'][-100:], alice.qkd_sender.trace.to_array()['photon_count'][-100:])
+    assert alice.qkd_sender.trace_writer is None
+
+def test_trace_streaming_needs_per_slot_trace(tmp_path):
+    alice, bob = _link()
+    with pytest.raises(ValueError):
+        alice.generate_and_share_key(bob, 100, 1, trace_directory=str(tmp_path))
@@ -0,0 +1,44 @@
+from Sweep import expand_parameter_grid, point_id, run_parameter_sweep
+
+import csv
+import json
+
+import pytest
+
+GRID = {'distance_km': [5, 10, 20]}
+BASE_PARAMS = {'num_pulses_per_link': 5000}
+
+def _read_records(path):
+    if path.endswith('.jsonl'):
+        with open(path) as output_file:
+            return [json.loads(line) for line in output_file]
+    with open(path, newline='') as output_file:
+        return list(csv.DictReader(output_file))
+
+def test_point_ids_are_stable_and_distinct():
+    points = expand_parameter_grid(GRID, BASE_PARAMS)
+    assert len({point_id(point) for point in points}) == 3
+    assert [point_id(point) for point in points] == [point_id(point) for point in expand_parameter_grid(GRID, BASE_PARAMS)]
+    with pytest.raises(ValueError):
+        expand_parameter_grid({'distance': [1]})
+
+@pytest.mark.parametrize('extension', ['.jsonl', '.csv'])
+def test_resume_after_an_interrupted_write(tmp_path, extension):
+    output_path = str(tmp_path / ('sweep' + extension))
+    run_parameter_sweep(GRID, output_path, BASE_PARAMS, max_workers=1)
+    complete = {record['point_id']: record for record in _read_records(output_path)}
+
+    # an interrupted run leaves the last record cut off mid-line
+    with open(output_path, 'rb') as output_file:
+        content = output_file.read()
+    with open(output_path, 'wb') as output_file:
+        output_file.write(content[:-len(content.splitlines(keepends=True)[-1]) // 2])
+
+    resumed = run_parameter_sweep(GRID, output_path, BASE_PARAMS, max_workers=1)
+    assert len(resumed) == 1
+    records = _read_records(output_path)
+    assert sorted(record['point_id'] for record in records) == sorted(complete)
+    for record in records:
+        assert record['sifted_key_length'] == complete[record['point_id']]['sifted_key_length']
+
+    assert run_parameter_sweep(GRID, output_path, BASE_PARAMS, max_workers=1) == []
@@ -0,0 +1,65 @@
+from Topology import Topology
+
+import itertools
+
+import numpy as np
+import pytest
+
+def _weights(loss, key_rate=1.0):
+    return {'loss': loss, 'key_rate': key_rate}
+
+def _assert_matches_fresh_routes(topology):
+    fresh = Topology()
+    fresh.adjacency = topology.adjacency
+    for source_id, metric in itertools.product(topology.adjacency, ('loss', 'key_rate')):
+        assert topology.routing_table(source_id, metric)[0] == fresh._dijkstra(source_id, metric)[0]
+
+def test_shortest_path_on_a_chain():
+    topology = Topology()
+    for node_id in range(4):
+        topology.add_link(node_id, node_id + 1, _weights(1.0))
+    assert topology.shortest_path(0, 4) == [0, 1, 2, 3, 4]
+    assert topology.shortest_path(4, 1) == [4, 3, 2, 1]
+
+def test_adding_a_shortcut_invalidates_cached_routes():
+    topology = Topology()
+    for node_id in range(4):
+        topology.add_link(node_id, node_id + 1, _weights(1.0))
+    assert topology.shortest_path(0, 4) == [0, 1, 2, 3, 4]
+    topology.add_link(0, 4, _weights(0.5))
+    assert topology.shortest_path(0, 4) == [0, 4]
+    assert topology.shortest_path(1, 4) == [1, 0, 4]
+
+def test_removing_a_used_link_invalidates_cached_routes():
+    topology = Topology()
+    for node_id in range(4):
+        topology.add_link(node_id, node_id + 1, _weights(1.0))
+    topology.add_link(0, 4, _weights(10.0))
+    assert topology.shortest_path(0, 4) == [0, 1, 2, 3, 4]
+    topology.remove_link(2, 3)
+    assert topology.shortest_path(0, 4) == [0, 4]
+    topology.remove_link(0, 4)
+    with pytest.raises(ValueError):
+        topology.shortest_path(0, 4)
+
+def test_making_a_used_link_longer_invalidates_cached_routes():
+    topology = Topology()
+    topology.add_link('a', 'b', _weights(1.0))
+    topology.add_link('b', 'c', _weights(1.0))
+    topology.add_link('a', 'c', _weights(3.0))
+    assert topology.shortest_path('a', 'c') == ['a', 'b', 'c']
+    topology.add_link('a', 'b', _weights(5.0))
+    assert topology.shortest_path('a', 'c') == ['a', 'c']
+
+def test_cached_routes_match_fresh_dijkstra_under_random_changes():
+    rng = np.random.default_rng(3)
+    topology = Topology()
+    num_nodes = 12
+    for _ in range(200):
+        node1_id, node2_id = (int(node_id) for node_id in rng.choice(num_nodes, size=2, replace=False))
+        if topology.has_link(node1_id, node2_id) and rng.random() < 0.4:
+            topology.remove_link(node1_id, node2_id)
+        else:
+            topology.add_link(node1_id, node2_id, _weights(float(rng.random()), float(rng.random())),
+                              _weights(float(rng.random()), float(rng.random())))
+        _assert_matches_fresh_routes(topology)
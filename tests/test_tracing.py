@@ -0,0 +1,32 @@
+from Source import Sender, SENT_PULSE_DTYPE
+from Tracing import TraceBuffer
+
+import numpy as np
+
+def _buffer(time_slots, capacity):
+    trace = TraceBuffer(SENT_PULSE_DTYPE, capacity)
+    trace.append_columns({'time_slot': time_slots, 'photon_count': np.arange(len(time_slots)),
+                          'modulated_phase': np.zeros(len(time_slots)),
+                          'alice_intended_bit_for_pair': np.zeros(len(time_slots), dtype=np.int8)})
+    return trace
+
+def test_lookup_of_evenly_spaced_slots_after_wrapping():
+    trace = _buffer(3 * np.arange(1000), capacity=64)
+    assert trace.lookup('time_slot', 3 * 999)['photon_count'] == 999
+    assert trace.lookup('time_slot', 3 * 936)['photon_count'] == 936
+    assert trace.lookup('time_slot', 3 * 935) is None
+    assert trace.lookup('time_slot', 3 * 950 + 1) is None
+
+def test_lookup_of_unevenly_spaced_slots_returns_most_recent():
+    trace = _buffer([0, 1, 5, 7, 5, 20], capacity=8)
+    assert trace.lookup('time_slot', 5)['photon_count'] == 4
+    assert trace.lookup('time_slot', 7)['photon_count'] == 3
+    assert trace.lookup('time_slot', 2) is None
+    assert TraceBuffer(SENT_PULSE_DTYPE, 4).lookup('time_slot', 0) is None
+
+def test_sender_pulse_lookup_in_sampled_trace():
+    sender = Sender(rng=np.random.default_rng(0), trace_level='sampled', trace_capacity=16, trace_sample_every=10)
+    pulses = sender.prepare_pulses(200, pulse_repetition_rate_ns=2)
+    assert sender.get_pulse_info(2 * 190)['photon_count'] == pulses['photon_count'][190]
+    assert sender.get_pulse_info(2 * 191) is None
+    assert sender.get_pulse_info(0) is None